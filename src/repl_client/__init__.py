@@ -1,26 +1,863 @@
 import ast
+import binascii
+import functools
 import hashlib
+import io
+import json
+import mmap
 import os
 import shutil
+import stat
 import time
 import struct
-import websocket
-import serial
+import tempfile
+import threading
+import zlib
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 
-class BaseReplClient:
+FileStat = namedtuple("FileStat", ["isdir", "size", "mtime"])
+SyncResult = namedtuple("SyncResult", ["created", "copied", "removed"])
+FleetResult = namedtuple("FleetResult", ["name", "result", "error", "elapsed"])
+SnapshotEntry = namedtuple("SnapshotEntry", ["stat", "sha256"])
+
+MANIFEST_PATHNAME = "/.repl_client_manifest"
+AGENT_PATHNAME = "/repl_client_agent.py"
+AGENT_SOURCE = """import sys, uos, hashlib, ustruct, ubinascii, micropython
+
+
+def stat(p):
+    s = uos.stat(p)
+    return ustruct.pack('<BII', (s[0] & 0x4000) != 0, s[6], s[8])
+
+
+def listdir(p):
+    return '\\0'.join(uos.listdir(p)).encode()
+
+
+def mkdir(p):
+    uos.mkdir(p)
+    return b''
+
+
+def remove(p):
+    uos.remove(p)
+    return b''
+
+
+def sha256(p):
+    h = hashlib.sha256()
+    b = bytearray(1024)
+    mv = memoryview(b)
+    with open(p, 'rb') as f:
+        while True:
+            n = f.readinto(b)
+            if not n:
+                break
+            h.update(mv[:n])
+    return h.digest()
+
+
+OPS = {1: stat, 2: listdir, 3: mkdir, 4: remove, 5: sha256}
+
+
+def serve(text):
+    i = sys.stdin.buffer
+    o = sys.stdout.buffer
+    micropython.kbd_intr(-1)
+    try:
+        while True:
+            if text:
+                r = ubinascii.a2b_base64(i.readline())
+                op, n = ustruct.unpack('<BH', r[:3])
+                arg = r[3:]
+            else:
+                op, n = ustruct.unpack('<BH', i.read(3))
+                arg = i.read(n) if n else b''
+            if op == 0:
+                break
+            for p in arg.decode().split('\\0'):
+                try:
+                    r = OPS[op](p)
+                    st = 0
+                except Exception as e:
+                    r = str(e.args[0] if e.args else e).encode()
+                    st = 1
+                r = ustruct.pack('<BI', st, len(r)) + r
+                o.write(ubinascii.b2a_base64(r) if text else r)
+    finally:
+        micropython.kbd_intr(3)
+"""
+
+
+def _read_chunks(source, chunk_size):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast("B")
+        for i in range(0, len(view), chunk_size):
+            yield view[i:i+chunk_size]
+    elif hasattr(source, "readinto"):
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            sz = source.readinto(buffer)
+            if not sz:
+                break
+            yield view[:sz]
+    elif hasattr(source, "read"):
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        for chunk in source:
+            yield from _read_chunks(chunk, chunk_size)
+
+
+def _payload_size(arg):
+    if isinstance(arg, str):
+        return len(arg)
+    if isinstance(arg, dict):
+        return sum(_payload_size(value) or 0 for value in arg.values())
+    if isinstance(arg, (list, tuple)):
+        return sum(_payload_size(item) or 0 for item in arg)
+    size = _stream_size(arg)
+    if size is None and (hasattr(arg, "read") or hasattr(arg, "__next__")):
+        return None
+    return size or 0
+
+
+def _pack_tree(files):
+    directories = set()
+    for pathname in files:
+        parent = pathname.rsplit("/", 1)[0]
+        while parent and parent not in directories:
+            directories.add(parent)
+            parent = parent.rsplit("/", 1)[0]
+    archive = bytearray()
+    for pathname in sorted(directories, key=lambda p: (p.count("/"), p)):
+        name = pathname.encode('utf-8')
+        archive += struct.pack("<BHI", 1, len(name), 0) + name
+    for pathname, content in files.items():
+        name = pathname.encode('utf-8')
+        archive += struct.pack("<BHI", 2, len(name), len(content)) + name
+        archive += content
+    archive += struct.pack("<BHI", 0, 0, 0)
+    return bytes(archive)
+
+
+def _unpack_tree(archive):
+    files = {}
+    offset = 0
+    while True:
+        kind, length, size = struct.unpack_from("<BHI", archive, offset)
+        offset += 7
+        if kind == 0:
+            return files
+        pathname = bytes(archive[offset:offset+length]).decode('utf-8')
+        offset += length
+        if kind == 3:
+            raise RuntimeError(f"No such file '{pathname}'")
+        files[pathname] = bytes(archive[offset:offset+size])
+        offset += size
+
+
+def _compress(data):
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 10)
+    return compressor.compress(data) + compressor.flush()
+
+
+def _stream_size(source):
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    try:
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END) - position
+        source.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+class Instrumentation:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.bytes_sent = 0
+            self.bytes_received = 0
+            self.round_trips = 0
+            self.sleep_time = 0.0
+            self.awaiting_response = False
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def record_send(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        with self.lock:
+            self.bytes_sent += len(data)
+            self.awaiting_response = True
+        for hook in self.hooks:
+            hook("send", data)
+
+    def record_recv(self, data):
+        with self.lock:
+            self.bytes_received += len(data)
+            if self.awaiting_response and data:
+                self.round_trips += 1
+                self.awaiting_response = False
+        for hook in self.hooks:
+            hook("recv", data)
+
+    def record_sleep(self, seconds):
+        with self.lock:
+            self.sleep_time += seconds
+
+    def record_timing(self, name, elapsed):
+        with self.lock:
+            timing = self.timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "round_trips": self.round_trips,
+                "sleep_time": self.sleep_time,
+                "timings": {
+                    name: {"count": count, "total": total, "max": longest}
+                    for name, (count, total, longest) in self.timings.items()
+                },
+            }
+
+
+class WireTrace:
+    def __init__(self, limit=None):
+        self.records = deque(maxlen=limit)
+
+    def __call__(self, direction, data):
+        self.records.append((time.monotonic(), direction, bytes(data)))
+
+    def dump(self):
+        return "\n".join(f"{timestamp:.6f} {direction} {data!r}" for timestamp, direction, data in self.records)
+
+
+def _instrumented(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        name = method.__name__
+        if self.instrumentation is None or name in self.active_timings:
+            return method(self, *args, **kwargs)
+        self.active_timings.add(name)
+        start = time.monotonic()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.active_timings.discard(name)
+            if self.instrumentation is not None:
+                self.instrumentation.record_timing(name, time.monotonic() - start)
+    return wrapper
+
+
+def _bounded(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.operation_timeout is None or self.deadline is not None:
+            return method(self, *args, **kwargs)
+        sizes = [_payload_size(arg) for arg in args]
+        timeout = self.timeout_for(sum(size for size in sizes if size is not None))
+        previous_timeout = self.get_timeout()
+        self.deadline = time.monotonic() + timeout
+        # the size of a stream or iterator is only known once it has been sent
+        self.extend_on_send = None in sizes
+        self.set_timeout(timeout)
+        try:
+            return method(self, *args, **kwargs)
+        except TimeoutError:
+            self.resync()
+            raise
+        finally:
+            self.deadline = None
+            self.extend_on_send = False
+            self.set_timeout(previous_timeout)
+    return wrapper
+
+
+class ReplScripts:
+    def load_manifest_script(self):
+        if self.manifest_pathname is None:
+            return ""
+        return f"""
+import ujson
+c = False
+try:
+  with open({repr(self.manifest_pathname)}) as mf:
+    m = ujson.load(mf)
+except (OSError, ValueError):
+  m = {{}}
+"""
+
+    def save_manifest_script(self):
+        if self.manifest_pathname is None:
+            return ""
+        return f"""
+if c:
+  with open({repr(self.manifest_pathname)}, 'w') as mf:
+    ujson.dump(m, mf)
+"""
+
+    def update_manifest_script(self, pathname, hexdigest):
+        return self.load_manifest_script() + f"""
+import uos
+s = uos.stat({repr(pathname)})
+m[{repr(pathname)}] = [s[6], s[8], {repr(hexdigest)}]
+c = True
+""" + self.save_manifest_script()
+
+    def remove_script(self, pathname):
+        script = f"uos.remove({repr(pathname)})\n"
+        if self.manifest_pathname is None:
+            return script
+        return script + self.load_manifest_script() + f"""
+if m.pop({repr(pathname)}, None) is not None:
+  c = True
+""" + self.save_manifest_script()
+
+    def sha256_many_script(self, pathnames, chunk_size):
+        script = f"""
+import hashlib
+b = bytearray({chunk_size})
+mv = memoryview(b)
+def hf(p):
+  h = hashlib.sha256()
+  f = open(p, 'rb')
+  while True:
+    n = f.readinto(b)
+    if not n:
+      break
+    h.update(mv[:n])
+  f.close()
+  return h.digest()
+"""
+        if self.manifest_pathname is None:
+            return script + f"d = [hf(p) for p in {repr(list(pathnames))}]\n"
+        return script + self.load_manifest_script() + f"""
+import uos, ubinascii
+d = []
+for p in {repr(list(pathnames))}:
+  s = uos.stat(p)
+  e = m.get(p)
+  if e is None or e[0] != s[6] or e[1] != s[8]:
+    e = m[p] = [s[6], s[8], ubinascii.hexlify(hf(p)).decode()]
+    c = True
+  d.append(ubinascii.unhexlify(e[2]))
+""" + self.save_manifest_script()
+
+    def stat_many_script(self, pathnames):
+        return f"""
+import uos
+d = []
+for p in {repr(list(pathnames))}:
+  try:
+    s = uos.stat(p)
+    d.append(((s[0] & 0x4000) != 0, s[6], s[8]))
+  except OSError:
+    d.append(None)
+"""
+
+    def walk_script(self, root):
+        return f"""
+import uos
+d = {{}}
+def w(r):
+  for e in uos.ilistdir(r or '/'):
+    p = r + '/' + e[0]
+    s = uos.stat(p)
+    d[p] = ((s[0] & 0x4000) != 0, s[6], s[8])
+    if s[0] & 0x4000:
+      w(p)
+w({repr(root.rstrip('/'))})
+"""
+
+    def compression_script(self):
+        return """
+d = [False, False]
+try:
+  import deflate, io
+  d[0] = True
+  g = deflate.DeflateIO(io.BytesIO(), deflate.ZLIB, 10)
+  g.write(b'x')
+  g.close()
+  d[1] = True
+except Exception:
+  try:
+    import zlib
+    d[0] = hasattr(zlib, 'decompress')
+  except ImportError:
+    pass
+"""
+
+    def decode_script(self, compress):
+        if compress:
+            return """
+try:
+  import deflate, io
+  def z(b):
+    return deflate.DeflateIO(io.BytesIO(b), deflate.ZLIB).read()
+except ImportError:
+  import zlib
+  def z(b):
+    return zlib.decompress(b)
+def u(line):
+  data = ubinascii.a2b_base64(line[1:])
+  return z(data) if line[0] == 'z' else data
+"""
+        return """
+def u(line):
+  return ubinascii.a2b_base64(line)
+"""
+
+    def record_upload_script(self):
+        return self.load_manifest_script() + ("""
+import uos
+s = uos.stat(p)
+m[p] = [s[6], s[8], x]
+c = True
+""" if self.manifest_pathname is not None else "") + self.save_manifest_script() + """
+print(x, end='')
+"""
+
+    def put_file_script(self, pathname, compress=False):
+        return f"""
+import sys, ubinascii, hashlib
+{self.decode_script(compress)}
+p = {repr(pathname)}
+f = open(p, 'wb')
+h = hashlib.sha256()
+while True:
+  sys.stdout.write('\\x06')
+  line = sys.stdin.readline().strip()
+  if not line:
+    break
+  data = u(line)
+  f.write(data)
+  h.update(data)
+f.close()
+x = ubinascii.hexlify(h.digest()).decode()
+""" + self.record_upload_script()
+
+    def block_hashes_script(self, pathname, block_size):
+        return f"""
+import uos, hashlib, ubinascii
+b = bytearray({block_size})
+mv = memoryview(b)
+try:
+  s = uos.stat({repr(pathname)})[6]
+  f = open({repr(pathname)}, 'rb')
+  l = []
+  while True:
+    n = f.readinto(b)
+    if not n:
+      break
+    l.append(hashlib.sha256(mv[:n]).digest()[:8])
+  f.close()
+  d = (s, ubinascii.hexlify(b''.join(l)).decode())
+except OSError:
+  d = None
+"""
+
+    def patch_file_script(self, pathname, size, block_size, rebuild, compress=False):
+        if rebuild:
+            patch = f"""
+src = open(p, 'rb')
+f = open(p + '.part', 'wb')
+i, data = r()
+for j in range({(size + block_size - 1) // block_size}):
+  if j == i:
+    f.write(data)
+    i, data = r()
+  else:
+    src.seek(j * {block_size})
+    f.write(src.read(min({block_size}, {size} - j * {block_size})))
+src.close()
+f.close()
+uos.remove(p)
+uos.rename(p + '.part', p)
+"""
+        else:
+            patch = f"""
+f = open(p, 'r+b')
+while True:
+  i, data = r()
+  if i is None:
+    break
+  f.seek(i * {block_size})
+  f.write(data)
+f.close()
+"""
+        return f"""
+import sys, uos, ubinascii, hashlib
+{self.decode_script(compress)}
+p = {repr(pathname)}
+def r():
+  sys.stdout.write('\\x06')
+  line = sys.stdin.readline().strip()
+  if not line:
+    return None, None
+  i, data = line.split(':')
+  return int(i), u(data)
+{patch}
+h = hashlib.sha256()
+b = bytearray({block_size})
+mv = memoryview(b)
+f = open(p, 'rb')
+while True:
+  n = f.readinto(b)
+  if not n:
+    break
+  h.update(mv[:n])
+f.close()
+x = ubinascii.hexlify(h.digest()).decode()
+""" + self.record_upload_script()
+
+    def encode_script(self, compress):
+        # frames carry at most 0x7fff bytes, bit 0x8000 of the length marks a compressed frame
+        if compress:
+            return """
+import deflate, io
+def e(v):
+  mv = memoryview(v)
+  for i in range(0, len(mv), 0x7fff):
+    c = mv[i:i+0x7fff]
+    o = io.BytesIO()
+    g = deflate.DeflateIO(o, deflate.ZLIB, 10)
+    g.write(c)
+    g.close()
+    z = o.getvalue()
+    if len(z) < len(c):
+      sys.stdout.buffer.write(ustruct.pack('<H', 0x8000 | len(z)))
+      sys.stdout.buffer.write(z)
+    else:
+      sys.stdout.buffer.write(ustruct.pack('<H', len(c)))
+      sys.stdout.buffer.write(c)
+"""
+        return """
+def e(v):
+  mv = memoryview(v)
+  for i in range(0, len(mv), 0x7fff):
+    c = mv[i:i+0x7fff]
+    sys.stdout.buffer.write(ustruct.pack('<H', len(c)))
+    sys.stdout.buffer.write(c)
+"""
+
+    def get_file_script(self, pathname, chunk_size, compress=False):
+        return f"""
+import sys, uos, hashlib, ustruct
+{self.encode_script(compress)}
+f = open({repr(pathname)}, 'rb')
+h = hashlib.sha256()
+b = bytearray({chunk_size})
+mv = memoryview(b)
+sys.stdout.write('\\x06')
+sys.stdout.buffer.write(ustruct.pack('<I', uos.stat({repr(pathname)})[6]))
+while True:
+  n = f.readinto(b)
+  if not n:
+    break
+  h.update(mv[:n])
+  e(mv[:n])
+f.close()
+sys.stdout.buffer.write(ustruct.pack('<H', 0))
+sys.stdout.buffer.write(h.digest())
+"""
+
+    def inflate_file_script(self, source, pathname, chunk_size):
+        return f"""
+import uos, ubinascii, hashlib
+try:
+  import deflate
+  def z(f):
+    return deflate.DeflateIO(f, deflate.ZLIB)
+except ImportError:
+  import io, zlib
+  def z(f):
+    return io.BytesIO(zlib.decompress(f.read()))
+p = {repr(pathname)}
+i = open({repr(source)}, 'rb')
+g = z(i)
+f = open(p, 'wb')
+h = hashlib.sha256()
+b = bytearray({chunk_size})
+mv = memoryview(b)
+while True:
+  n = g.readinto(b)
+  if not n:
+    break
+  f.write(mv[:n])
+  h.update(mv[:n])
+f.close()
+i.close()
+uos.remove({repr(source)})
+x = ubinascii.hexlify(h.digest()).decode()
+""" + self.record_upload_script()
+
+    def deflate_file_script(self, pathname, target, chunk_size, overhead):
+        return f"""
+import uos, deflate
+try:
+  s = uos.stat({repr(pathname)})[6]
+except OSError:
+  s = None
+d = None
+if s is not None:
+  i = open({repr(pathname)}, 'rb')
+  o = open({repr(target)}, 'wb')
+  g = deflate.DeflateIO(o, deflate.ZLIB, 10)
+  b = bytearray({chunk_size})
+  mv = memoryview(b)
+  while True:
+    n = i.readinto(b)
+    if not n:
+      break
+    g.write(mv[:n])
+  g.close()
+  o.close()
+  i.close()
+  c = uos.stat({repr(target)})[6]
+  if s - c <= {int(overhead)}:
+    uos.remove({repr(target)})
+    c = None
+  d = (s, c)
+"""
+
+    def put_tree_script(self, compress=False):
+        return f"""
+import sys, uos, ubinascii, hashlib, ustruct
+{self.decode_script(compress)}
+""" + self.load_manifest_script() + """
+h = hashlib.sha256()
+q = b''
+def rd(n):
+  global q
+  while len(q) < n:
+    sys.stdout.write('\\x06')
+    data = u(sys.stdin.readline().strip())
+    h.update(data)
+    q += data
+  r = q[:n]
+  q = q[n:]
+  return r
+while True:
+  k, l, s = ustruct.unpack('<BHI', rd(7))
+  if not k:
+    break
+  p = rd(l).decode()
+  if k == 1:
+    try:
+      uos.mkdir(p)
+    except OSError:
+      pass
+    continue
+  f = open(p, 'wb')
+  g = hashlib.sha256()
+  while s:
+    v = rd(min(s, 1024))
+    f.write(v)
+    g.update(v)
+    s -= len(v)
+  f.close()
+""" + ("""
+  t = uos.stat(p)
+  m[p] = [t[6], t[8], ubinascii.hexlify(g.digest()).decode()]
+  c = True
+""" if self.manifest_pathname is not None else "") + self.save_manifest_script() + """
+print(ubinascii.hexlify(h.digest()).decode(), end='')
+"""
+
+    def get_tree_script(self, pathnames, chunk_size, text=False, compress=False):
+        if text:
+            encode = """
+def e(v):
+  sys.stdout.write(ubinascii.b2a_base64(v).decode())
+"""
+            end = """
+sys.stdout.write('\\n')
+print(ubinascii.hexlify(h.digest()).decode())
+"""
+        else:
+            encode = self.encode_script(compress)
+            end = """
+sys.stdout.buffer.write(ustruct.pack('<H', 0))
+sys.stdout.buffer.write(h.digest())
+"""
+        return f"""
+import sys, uos, hashlib, ustruct, ubinascii
+{encode}
+h = hashlib.sha256()
+o = bytearray()
+def w(v):
+  global o
+  h.update(v)
+  o += v
+  if len(o) >= {chunk_size}:
+    e(o)
+    o = bytearray()
+b = bytearray({chunk_size})
+mv = memoryview(b)
+sys.stdout.write('\\x06')
+for p in {repr(list(pathnames))}:
+  n = p.encode()
+  try:
+    f = open(p, 'rb')
+    s = uos.stat(p)[6]
+  except OSError:
+    w(ustruct.pack('<BHI', 3, len(n), 0) + n)
+    continue
+  w(ustruct.pack('<BHI', 2, len(n), s) + n)
+  while s:
+    k = f.readinto(b)
+    if not k:
+      raise OSError(5)
+    k = min(k, s)
+    w(mv[:k])
+    s -= k
+  f.close()
+w(ustruct.pack('<BHI', 0, 0, 0))
+if o:
+  e(o)
+""" + end
+
+    def wifi_connect_script(self, ssid, psk):
+        return f"sta_if.connect({repr(ssid)}, {repr(psk)})"
+
+    def wifi_disconnect_script(self):
+        return "sta_if.disconnect()"
+
+    def webrepl_start_script(self, password):
+        return f"webrepl.start(password={repr(password)})"
+
+
+class ReplProtocol(ReplScripts):
+    def assert_error(self, error):
+        if error != b"":
+            self.session.clear()
+            print(error)
+            raise Exception()
+
+    @staticmethod
+    def response_part(response):
+        if not response.endswith(b"\x04"):
+            raise TimeoutError("Timed out waiting for the end of a REPL response")
+        return response[:-1]
+
+    def eval_result(self, result, error):
+        self.assert_error(error)
+        return ast.literal_eval(result.decode('utf-8'))
+
+    def webrepl_request(self, opcode, sz, b_pathname):
+        return struct.pack(self.WEBREPL_REQ_S, b"WA", opcode, 0, 0, sz, len(b_pathname), b_pathname)
+
+    @staticmethod
+    def webrepl_response_code(data):
+        sig, code = struct.unpack("<2sH", data)
+        assert sig == b"WB"
+        return code
+
+
+class BaseReplClient(ReplProtocol):
+    PIPELINE_WINDOW = 256
+    BINARY_STDOUT = True
+    AGENT_TEXT_MODE = False
+    AGENT_STAT = 1
+    AGENT_LISTDIR = 2
+    AGENT_MKDIR = 3
+    AGENT_REMOVE = 4
+    AGENT_SHA256 = 5
+    DEFAULT_RTT = 0.1
+    PROBE_TIMEOUT = 0.25
+    RTT_FACTOR = 4
+    MIN_THROUGHPUT = 1000
+
     def _import(self, module_name):
-        self.exec(f"import {module_name}")
+        if module_name not in self.session:
+            result, error = self.exec(f"import {module_name}")
+            if error == b"":
+                self.session.add(module_name)
+
+    def _assign(self, name, expression):
+        if name not in self.session:
+            result, error = self.exec(f"{name} = {expression}")
+            self.assert_error(error)
+            self.session.add(name)
 
     def with_timeout(self, timeout, callback):
         previous_timeout = self.get_timeout()
         self.set_timeout(timeout)
-        retval = callback()
-        self.set_timeout(previous_timeout)
-        return retval
+        try:
+            return callback()
+        finally:
+            self.set_timeout(previous_timeout)
+
+    def record_rtt(self, rtt):
+        self.rtt = rtt if self.rtt is None else 0.875 * self.rtt + 0.125 * rtt
+
+    def timeout_for(self, payload_size):
+        rtt = self.rtt if self.rtt is not None else self.DEFAULT_RTT
+        return self.operation_timeout + self.RTT_FACTOR * rtt + payload_size / self.MIN_THROUGHPUT
+
+    def extend_deadline(self, received):
+        if self.deadline is not None:
+            self.deadline += received / self.MIN_THROUGHPUT
+
+    def on_send(self, message):
+        if self.instrumentation is not None:
+            self.instrumentation.record_send(message)
+        if self.extend_on_send:
+            self.extend_deadline(len(message))
+
+    def deadline_pending(self):
+        if self.deadline is None:
+            return False
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("REPL operation did not complete within its deadline")
+        self.set_timeout(remaining)
+        return True
+
+    def resync(self):
+        agent_serving = self.agent_serving
+        self.deadline = None
+        self.agent_serving = False
+        self.in_raw_repl_mode = False
+        self.session.clear()
+        self.with_timeout(self.timeout_for(0), lambda: self._resync(agent_serving))
+
+    def _resync(self, agent_serving=False):
+        if agent_serving:
+            # The agent ignores Ctrl-C, ask it to return to the raw REPL first
+            self.send(self.encode_agent_request(0, b""))
+        self.send(b"\x03\x03")
+        self.sleep(0.1)
+        self.send(b"\x02")
+        self.send(b"print('resync' + 'ed')\r")
+        if not self.recv_until(b"resynced\r\n>>> ").endswith(b"resynced\r\n>>> "):
+            raise TimeoutError("REPL did not respond to Ctrl-C/Ctrl-B after a timeout")
 
     def assert_recv(self, expected):
-        actual = self.recv(len(expected))
+        actual = self.recv_exactly(len(expected))
         if actual != expected:
             print()
             print('---')
@@ -29,33 +866,189 @@ class BaseReplClient:
             print('---')
             raise Exception()
 
-    def assert_error(self, error):
-        if error != b"":
-            print(error)
-            raise Exception()
-
     def __init__(self, connection, **kwargs):
         self.connection = connection
-
-        self.establish_connection(**kwargs)
-        self.recv_until(b">>> ")
+        self.rx = bytearray()
+        self.instrumentation = kwargs.pop('instrumentation', None)
+        self.operation_timeout = kwargs.pop('operation_timeout', None)
+        attach = kwargs.pop('attach', False)
+        manifest_pathname = kwargs.pop('manifest_pathname', MANIFEST_PATHNAME)
+        use_manifest = kwargs.pop('use_manifest', False)
+        self.active_timings = set()
+        self.deadline = None
+        self.extend_on_send = False
+        self.rtt = None
+        self.throughput = None
+
+        if attach:
+            self.attach_connection(**kwargs)
+        else:
+            self.establish_connection(**kwargs)
+            self.recv_until(b">>> ")
 
         self.in_raw_repl_mode = False
+        self.use_raw_paste_mode = True
+        self.use_compression = True
+        self.compression = None
+        self.session = set()
+        self.manifest_pathname = manifest_pathname if use_manifest else None
+        self.use_agent = False
+        self.agent_installed = False
+        self.agent_serving = False
+        self.attached_mode = self.probe_mode() if attach else None
+
+    def attach_connection(self, **kwargs):
+        pass
+
+    def drain(self):
+        while True:
+            tmp = self.recv_some()
+            if not tmp:
+                break
+            self.rx += tmp
+        return self.take(len(self.rx))
+
+    def probe_mode(self):
+        self.send(b"\x03\x03")
+        drained = self.with_timeout(self.PROBE_TIMEOUT, self.drain)
+        self.send(b"\r\x01")
+        response = self.recv_until(b"raw REPL; CTRL-B to exit\r\n>")
+        if not response.endswith(b"raw REPL; CTRL-B to exit\r\n>"):
+            raise RuntimeError("Device did not answer the REPL probe")
+        self.in_raw_repl_mode = True
+        if b">>> " in response:
+            self.enter_repl_mode()
+            return "friendly"
+        # Ctrl-C while receiving a raw-paste ends the data and raises without a traceback
+        if b"\x04KeyboardInterrupt" in drained:
+            return "raw-paste"
+        return "raw"
+
+    def enable_instrumentation(self, instrumentation=None):
+        if instrumentation is None:
+            instrumentation = Instrumentation()
+        self.instrumentation = instrumentation
+        return instrumentation
+
+    def disable_instrumentation(self):
+        self.instrumentation = None
+
+    def stats(self):
+        if self.instrumentation is None:
+            return None
+        return self.instrumentation.snapshot()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        if self.instrumentation is not None:
+            self.instrumentation.record_sleep(seconds)
 
     def enter_raw_repl_mode(self):
+        self.stop_agent()
         if not self.in_raw_repl_mode:
             self.send("\x01")
             self.recv_until(b">")
             self.in_raw_repl_mode = True
 
     def enter_repl_mode(self):
+        self.stop_agent()
         if self.in_raw_repl_mode:
             self.send("\x02")
             self.recv_until(b">>> ")
             self.in_raw_repl_mode = False
+            self.session.clear()
+
+    def soft_reset(self):
+        self.enter_raw_repl_mode()
+        self.send("\x04")
+        self.recv_until(b"raw REPL; CTRL-B to exit\r\n>")
+        self.session.clear()
+
+    def enter_raw_paste_mode(self):
+        start = time.monotonic()
+        self.send(b"\x05A\x01")
+        response = self.recv_exactly(2)
+        self.record_rtt(time.monotonic() - start)
+        if response == b"R\x01":
+            return True
+        if response != b"R\x00":
+            self.recv_until(b"w REPL; CTRL-B to exit\r\n>")
+        self.use_raw_paste_mode = False
+        return False
+
+    def send_raw_paste_command(self, command):
+        data = command.encode('utf-8')
+        (window_size,) = struct.unpack("<H", self.recv_exactly(2))
+        window_remaining = window_size
+        i = 0
+        while i < len(data):
+            while window_remaining == 0:
+                flow = self.recv_exactly(1)
+                if flow == b"\x01":
+                    window_remaining += window_size
+                elif flow == b"\x04":
+                    self.send(b"\x04")
+                    return
+                else:
+                    raise RuntimeError(f"Unexpected raw paste flow control byte {flow}")
+            chunk = data[i:i+window_remaining]
+            self.send(chunk)
+            window_remaining -= len(chunk)
+            i += len(chunk)
+        self.send(b"\x04")
+        self.recv_until(b"\x04")
+
+    def send_command(self, command):
+        if self.use_raw_paste_mode and self.enter_raw_paste_mode():
+            self.send_raw_paste_command(command)
+        else:
+            self.send_raw_command(command)
+
+    def take(self, sz):
+        data = bytes(self.rx[:sz])
+        del self.rx[:sz]
+        return data
+
+    def recv(self, sz=-1):
+        if not self.rx:
+            self.rx += self.recv_some()
+        return self.take(len(self.rx) if sz == -1 else sz)
+
+    def recv_exactly(self, sz):
+        while len(self.rx) < sz:
+            pending = self.deadline_pending()
+            tmp = self.recv_some()
+            if tmp == b"":
+                if pending:
+                    continue
+                raise TimeoutError(f"Timed out waiting for {sz} bytes from the device, got {len(self.rx)}")
+            self.extend_deadline(len(tmp))
+            self.rx += tmp
+        return self.take(sz)
+
+    def recv_until(self, expected=b"\n"):
+        timeout = self.get_timeout()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        start = 0
+        while True:
+            i = self.rx.find(expected, start)
+            if i >= 0:
+                return self.take(i + len(expected))
+            start = max(0, len(self.rx) - len(expected) + 1)
+            if deadline is not None and self.deadline is None and time.monotonic() >= deadline:
+                break
+            pending = self.deadline_pending()
+            tmp = self.recv_some()
+            if tmp == b"":
+                if pending:
+                    continue
+                break
+            self.extend_deadline(len(tmp))
+            self.rx += tmp
+        return self.take(len(self.rx))
 
     def read_response_part(self):
-        return self.recv_until(b"\x04")[:-1]
+        return self.response_part(self.recv_until(b"\x04"))
 
     def read_response(self):
         result = self.read_response_part()
@@ -63,68 +1056,365 @@ class BaseReplClient:
 
         return result, error
 
+    @_bounded
+    @_instrumented
     def exec(self, command):
         self.enter_raw_repl_mode()
         self.send_command(command)
         result, error = self.read_response()
         self.assert_recv(b">")
+        if error != b"":
+            self.session.clear()
         return result, error
 
-    def eval(self, expression):
-        result, error = self.exec(f"print(repr({expression}), end='')")
+    @_bounded
+    @_instrumented
+    def exec_many(self, commands):
+        self.enter_raw_repl_mode()
+        responses = []
+        pending = []
+        in_flight = 0
+
+        def read_pipelined_response():
+            self.assert_recv(b"OK")
+            result, error = self.read_response()
+            self.assert_recv(b">")
+            responses.append((result, error))
+
+        for command in commands:
+            data = command.encode('utf-8') + b"\x04"
+            oversized = len(data) > self.PIPELINE_WINDOW
+            while pending and (oversized or in_flight + len(data) > self.PIPELINE_WINDOW):
+                in_flight -= pending.pop(0)
+                read_pipelined_response()
+            if oversized:
+                self.send_command(command)
+                result, error = self.read_response()
+                self.assert_recv(b">")
+                responses.append((result, error))
+            else:
+                self.send(data)
+                pending.append(len(data))
+                in_flight += len(data)
+        for _ in pending:
+            read_pipelined_response()
+
+        if any(error != b"" for result, error in responses):
+            self.session.clear()
+        return responses
+
+    @_bounded
+    @_instrumented
+    def eval(self, expression, setup=""):
+        result, error = self.exec(f"{setup}print(repr({expression}), end='')")
+        return self.eval_result(result, error)
+
+    def update_manifest(self, pathname, hexdigest):
+        if self.manifest_pathname is not None:
+            result, error = self.exec(self.update_manifest_script(pathname, hexdigest))
+            self.assert_error(error)
+
+    def recv_ack(self):
+        ack = self.recv_exactly(1)
+        if ack == b"\x06":
+            return
+        if ack == b"\x04":
+            error = self.read_response_part()
+            self.assert_recv(b">")
+            self.assert_error(error)
+        raise RuntimeError(f"Expected acknowledgement from device, got {ack}")
+
+    def detect_compression(self):
+        if self.compression is None:
+            self.compression = tuple(self.eval("d", self.compression_script()))
+        return self.compression
+
+    def can_decompress(self):
+        return self.use_compression and self.detect_compression()[0]
+
+    def can_compress(self):
+        return self.use_compression and self.detect_compression()[1]
+
+    @_bounded
+    @_instrumented
+    def put_stream(self, pathname, source, chunk_size=1024):
+        compress = self.can_decompress()
+        self.enter_raw_repl_mode()
+        self.send_command(self.put_file_script(pathname, compress))
+        h = hashlib.sha256()
+        for chunk in _read_chunks(source, chunk_size):
+            h.update(chunk)
+            self.recv_ack()
+            self.send(self.encode_block(chunk, compress))
+        self.recv_ack()
+        self.send(b"\n")
+        result, error = self.read_response()
+        self.assert_recv(b">")
         self.assert_error(error)
-        return ast.literal_eval(result.decode('utf-8'))
+        if result.decode('utf-8') != h.hexdigest():
+            raise RuntimeError(f"Checksum mismatch after writing '{pathname}'")
+
+    def install_agent(self):
+        if self.agent_installed:
+            return
+        content = AGENT_SOURCE.encode('utf-8')
+        stat = self.eval("d", self.stat_many_script([AGENT_PATHNAME]))[0]
+        if stat is None or stat[1] != len(content) or \
+                self.eval("d", self.sha256_many_script([AGENT_PATHNAME], 1024))[0] != hashlib.sha256(content).digest():
+            self.put_file(AGENT_PATHNAME, content)
+            result, error = self.exec("import sys\nsys.modules.pop('repl_client_agent', None)")
+            self.assert_error(error)
+            self.session.discard("repl_client_agent")
+        self.agent_installed = True
+
+    def start_agent(self):
+        if not self.agent_serving:
+            self.install_agent()
+            self._import("repl_client_agent")
+            self.enter_raw_repl_mode()
+            self.send_command(f"repl_client_agent.serve({self.AGENT_TEXT_MODE})")
+            self.agent_serving = True
+
+    def stop_agent(self):
+        if self.agent_serving:
+            self.agent_serving = False
+            self.send(self.encode_agent_request(0, b""))
+            result, error = self.read_response()
+            self.assert_recv(b">")
+            self.assert_error(error)
+
+    def encode_agent_request(self, op, payload):
+        request = struct.pack("<BH", op, len(payload)) + payload
+        if self.AGENT_TEXT_MODE:
+            return binascii.b2a_base64(request)
+        return request
+
+    def recv_agent_response(self):
+        if self.AGENT_TEXT_MODE:
+            response = binascii.a2b_base64(self.recv_until(b"\n"))
+            status, size = struct.unpack("<BI", response[:5])
+            return status, response[5:]
+        status, size = struct.unpack("<BI", self.recv_exactly(5))
+        return status, self.recv_exactly(size)
+
+    @_bounded
+    def agent_request_many(self, op, pathnames):
+        self.start_agent()
+        requests = []
+        group = []
+        for pathname in pathnames:
+            payload = b"\0".join(group + [pathname.encode('utf-8')])
+            if group and len(self.encode_agent_request(op, payload)) > self.PIPELINE_WINDOW:
+                requests.append((self.encode_agent_request(op, b"\0".join(group)), len(group)))
+                group = []
+            group.append(pathname.encode('utf-8'))
+        if group:
+            requests.append((self.encode_agent_request(op, b"\0".join(group)), len(group)))
+
+        responses = []
+        pending = []
+        in_flight = 0
+        for request, count in requests:
+            while pending and in_flight + len(request) > self.PIPELINE_WINDOW:
+                sz, n = pending.pop(0)
+                in_flight -= sz
+                responses.extend(self.recv_agent_response() for _ in range(n))
+            self.send(request)
+            pending.append((len(request), count))
+            in_flight += len(request)
+        for sz, n in pending:
+            responses.extend(self.recv_agent_response() for _ in range(n))
+        return responses
+
+    def agent_request(self, op, pathnames):
+        responses = self.agent_request_many(op, pathnames)
+        for pathname, (status, payload) in zip(pathnames, responses):
+            if status != 0:
+                raise RuntimeError(f"Agent request {op} for '{pathname}' failed: {payload.decode('utf-8')}")
+        return [payload for status, payload in responses]
+
+    def agent_stat_many(self, pathnames):
+        retval = []
+        for status, payload in self.agent_request_many(self.AGENT_STAT, pathnames):
+            if status != 0:
+                retval.append(None)
+            else:
+                isdir, size, mtime = struct.unpack("<BII", payload)
+                retval.append(FileStat(bool(isdir), size, mtime))
+        return retval
+
+    def encode_block(self, chunk, compress):
+        if compress:
+            data = _compress(chunk)
+            if len(data) < len(chunk):
+                return b"z" + binascii.b2a_base64(data)
+            return b"r" + binascii.b2a_base64(chunk)
+        return binascii.b2a_base64(chunk)
+
+    @_bounded
+    @_instrumented
+    def put_file_delta(self, pathname, content, block_size=1024):
+        remote = self.eval("d", self.block_hashes_script(pathname, block_size))
+        if remote is None:
+            self.put_file(pathname, content)
+            return None
+        size, hexdigests = remote
+        digests = bytes.fromhex(hexdigests)
+        changed = []
+        for i in range(0, len(content), block_size):
+            j = i // block_size * 8
+            if hashlib.sha256(content[i:i+block_size]).digest()[:8] != digests[j:j+8]:
+                changed.append(i // block_size)
+
+        compress = self.can_decompress()
+        self.enter_raw_repl_mode()
+        self.send_command(self.patch_file_script(pathname, len(content), block_size, len(content) < size, compress))
+        for i in changed:
+            self.recv_ack()
+            self.send(str(i).encode('utf-8') + b":" + self.encode_block(content[i*block_size:(i+1)*block_size], compress))
+        self.recv_ack()
+        self.send(b"\n")
+        result, error = self.read_response()
+        self.assert_recv(b">")
+        self.assert_error(error)
+        if result.decode('utf-8') != hashlib.sha256(content).hexdigest():
+            self.put_file(pathname, content)
+            return None
+        return changed
+
+    @_bounded
+    @_instrumented
+    def put_tree(self, files, chunk_size=1024):
+        archive = _pack_tree(files)
+        compress = self.can_decompress()
+        self.enter_raw_repl_mode()
+        self.send_command(self.put_tree_script(compress))
+        for chunk in _read_chunks(archive, chunk_size):
+            self.recv_ack()
+            self.send(self.encode_block(chunk, compress))
+        result, error = self.read_response()
+        self.assert_recv(b">")
+        self.assert_error(error)
+        if result.decode('utf-8') != hashlib.sha256(archive).hexdigest():
+            raise RuntimeError("Checksum mismatch after writing tree")
+
+    def recv_frames(self, compress):
+        while True:
+            (sz,) = struct.unpack("<H", self.recv_exactly(2))
+            if sz == 0:
+                return
+            if not sz & 0x8000:
+                yield self.recv_exactly(sz)
+            elif compress:
+                yield zlib.decompress(self.recv_exactly(sz & 0x7fff))
+            else:
+                raise RuntimeError("Device sent a compressed frame although compression is off")
+
+    def recv_text_frames(self):
+        while True:
+            line = self.recv_until(b"\n")
+            if not line.endswith(b"\n"):
+                raise TimeoutError("Timed out waiting for a block of a tree transfer")
+            if not line.strip():
+                return
+            yield binascii.a2b_base64(line)
+
+    @_bounded
+    @_instrumented
+    def get_tree(self, pathnames, chunk_size=1024):
+        text = not self.BINARY_STDOUT
+        compress = not text and self.can_compress()
+        self.enter_raw_repl_mode()
+        self.send_command(self.get_tree_script(pathnames, chunk_size, text, compress))
+        self.recv_ack()
+        archive = bytearray()
+        for frame in self.recv_text_frames() if text else self.recv_frames(compress):
+            archive += frame
+        if text:
+            digest = binascii.unhexlify(self.recv_until(b"\n").strip())
+        else:
+            digest = self.recv_exactly(32)
+        result, error = self.read_response()
+        self.assert_recv(b">")
+        self.assert_error(error)
+        if hashlib.sha256(archive).digest() != digest:
+            raise RuntimeError("Checksum mismatch after reading tree")
+        return _unpack_tree(archive)
 
     def remove(self, pathname):
+        if self.use_agent and self.manifest_pathname is None:
+            return self.agent_request(self.AGENT_REMOVE, [pathname])[0]
         self._import("uos")
-        result, error = self.exec(f"uos.remove('{pathname}')")
+        result, error = self.exec(self.remove_script(pathname))
         self.assert_error(error)
         return result
 
-    def sha256(self, pathname):
-        chunk_size = 1024
-        self._import("hashlib")
-        self.exec("h = hashlib.sha256()")
-        self.exec(f"f = open('{pathname}', 'rb')")
-
-        self.exec(f"c = f.read({chunk_size})")
-        while self.eval("bool(c)"):
-            self.exec(f"h.update(c)")
-            self.exec(f"c = f.read({chunk_size})")
-        self.exec("f.close()")
-        return self.eval("h.digest()")
+    @_bounded
+    @_instrumented
+    def sha256(self, pathname, chunk_size=1024):
+        return self.sha256_many([pathname], chunk_size)[0]
+
+    @_bounded
+    @_instrumented
+    def sha256_many(self, pathnames, chunk_size=1024):
+        if self.use_agent and self.manifest_pathname is None:
+            return self.agent_request(self.AGENT_SHA256, list(pathnames))
+        return self.eval("d", self.sha256_many_script(pathnames, chunk_size))
 
     def mkdir(self, pathname):
+        if self.use_agent:
+            return self.agent_request(self.AGENT_MKDIR, [pathname])[0]
         self._import("uos")
-        result, error = self.exec(f"uos.mkdir('{pathname}')\r\n")
+        result, error = self.exec(f"uos.mkdir({repr(pathname)})\r\n")
         self.assert_error(error)
         return result
 
     def isfile(self, pathname):
+        if self.use_agent:
+            return not struct.unpack("<BII", self.agent_request(self.AGENT_STAT, [pathname])[0])[0]
         self._import("uos")
-        return self.eval(f"(uos.stat('{pathname}')[0] & 32768) == 32768")
+        return self.eval(f"(uos.stat({repr(pathname)})[0] & 32768) == 32768")
 
     def isdir(self, pathname):
+        if self.use_agent:
+            return bool(struct.unpack("<BII", self.agent_request(self.AGENT_STAT, [pathname])[0])[0])
         self._import("uos")
-        return self.eval(f"(uos.stat('{pathname}')[0] & 16384) == 16384")
+        return self.eval(f"(uos.stat({repr(pathname)})[0] & 16384) == 16384")
 
     def exists(self, pathname):
+        if self.use_agent:
+            return self.agent_stat_many([pathname])[0] is not None
         self._import("uos")
         self.exec(f"""
 exists=True
 try:
-  uos.stat('{pathname}')
+  uos.stat({repr(pathname)})
 except:
   exists=False
 """)
         return self.eval("exists")
 
     def listdir(self, pathname='/'):
+        if self.use_agent:
+            listing = self.agent_request(self.AGENT_LISTDIR, [pathname])[0].decode('utf-8')
+            return listing.split("\0") if listing else []
         self._import("uos")
-        return self.eval(f"uos.listdir('{pathname}')")
+        return self.eval(f"uos.listdir({repr(pathname)})")
+
+    def stat_many(self, pathnames):
+        if self.use_agent:
+            return self.agent_stat_many(pathnames)
+        return [None if s is None else FileStat(*s) for s in self.eval("d", self.stat_many_script(pathnames))]
+
+    def walk(self, root='/'):
+        tree = {p: FileStat(*s) for p, s in self.eval("d", self.walk_script(root)).items()}
+        tree.pop(self.manifest_pathname, None)
+        tree.pop(AGENT_PATHNAME, None)
+        return tree
 
     def close(self):
         self.enter_repl_mode()
+        self.session.clear()
         self.connection.close()
 
 
@@ -133,6 +1423,19 @@ class WebReplClient(BaseReplClient):
     WEBREPL_PUT_FILE = 1
     WEBREPL_GET_FILE = 2
     WEBREPL_GET_VER = 3
+    # fixed by the device firmware; more requests in flight than this plan allows desync the session
+    WEBREPL_BLOCK_SIZE = 256
+    BINARY_STDOUT = False
+    GET_WINDOW = 16
+    COMPRESSED_SUFFIX = ".rcz"
+    COMPRESSION_OVERHEAD_RTTS = 8
+    PIPELINE_WINDOW = 128
+    AGENT_TEXT_MODE = True
+
+    def __init__(self, connection, **kwargs):
+        import websocket
+        self.websocket_exception = websocket.WebSocketException
+        super().__init__(connection, **kwargs)
 
     def set_timeout(self, timeout):
         self.connection.settimeout(timeout)
@@ -140,26 +1443,28 @@ class WebReplClient(BaseReplClient):
     def get_timeout(self):
         return self.connection.gettimeout()
 
-    def recv(self, sz=-1):
+    def recv_some(self):
         try:
-            tmp = self.connection.recv()
-            return tmp if str(type(tmp)) == "<class 'bytes'>" else tmp.encode("utf-8")
-        except websocket.WebSocketException:
-            return b''
-
-    def recv_until(self, expected=b"/n"):
-        buf = b""
-        while not buf.endswith(expected):
-            tmp = self.recv()
-            if tmp == b'':
-                break
-            buf += tmp
-        return buf
+            tmp = b""
+            while not tmp:
+                tmp = self.connection.recv()
+                tmp = tmp if isinstance(tmp, bytes) else tmp.encode("utf-8")
+        except self.websocket_exception:
+            tmp = b''
+        if self.instrumentation is not None:
+            self.instrumentation.record_recv(tmp)
+        return tmp
 
     def send(self, message):
+        if isinstance(message, memoryview):
+            message = message.tobytes()
+        self.on_send(message)
         self.connection.send(message)
 
     def send_binary(self, message):
+        if isinstance(message, memoryview):
+            message = message.tobytes()
+        self.on_send(message)
         self.connection.send_binary(message)
 
     def establish_connection(self, **kwargs):
@@ -167,53 +1472,200 @@ class WebReplClient(BaseReplClient):
         self.send(kwargs['password'])
         self.send("\r\n")
 
-    def send_command(self, command):
+    def attach_connection(self, **kwargs):
+        self.establish_connection(**kwargs)
+
+    def send_raw_command(self, command):
         chunk_size = 128
         for i in range(0, len(command), chunk_size):
             chunk = command[i:i+chunk_size]
             self.send(chunk)
             if i + chunk_size < len(command):
-                time.sleep(0.3)
+                self.sleep(0.3)
         self.send("\x04")
         self.assert_recv(b"OK")
 
     def read_resp(self):
-        data = self.recv()
-        sig, code = struct.unpack("<2sH", data)
-        assert sig == b"WB"
-        return code
+        return self.webrepl_response_code(self.recv_exactly(4))
 
     def begin_transfer(self, opcode, sz, b_pathname):
         self.enter_repl_mode()
-        rec = struct.pack(self.WEBREPL_REQ_S, b"WA", opcode, 0, 0, sz, len(b_pathname), b_pathname)
-        self.send_binary(rec)
+        self.send_binary(self.webrepl_request(opcode, sz, b_pathname))
         assert self.read_resp() == 0
 
-    def put_file(self, pathname, content):
-        self.begin_transfer(self.WEBREPL_PUT_FILE, len(content), pathname.encode('utf-8'))
+    def record_throughput(self, size, elapsed):
+        if size >= 4 * self.WEBREPL_BLOCK_SIZE and elapsed > 0:
+            rate = size / elapsed
+            self.throughput = rate if self.throughput is None else 0.75 * self.throughput + 0.25 * rate
+
+    def compression_overhead(self):
+        if self.throughput is None or not self.use_raw_paste_mode:
+            return None
+        rtt = self.rtt if self.rtt is not None else self.DEFAULT_RTT
+        return self.COMPRESSION_OVERHEAD_RTTS * rtt * self.throughput
 
-        chunk_size = 1024
-        for i in range(0, len(content), chunk_size):
-            chunk = content[i:i+chunk_size]
+    def webrepl_put(self, pathname, source, size, chunk_size):
+        start = time.monotonic()
+        self.begin_transfer(self.WEBREPL_PUT_FILE, size, pathname.encode('utf-8'))
+
+        h = hashlib.sha256()
+        sent = 0
+        overrun = False
+        chunks = _read_chunks(source, chunk_size)
+        for chunk in chunks:
+            if len(chunk) > size - sent:
+                overrun = True
+                chunk = chunk[:size - sent]
             self.send_binary(chunk)
+            h.update(chunk)
+            sent += len(chunk)
+            if sent == size:
+                overrun = overrun or any(len(chunk) for chunk in chunks)
+                break
+        if sent != size:
+            raise RuntimeError(f"Expected {size} bytes for '{pathname}', got {sent}")
         assert self.read_resp() == 0
+        if overrun:
+            raise RuntimeError(f"Source for '{pathname}' holds more than the {size} bytes that were sent")
+        self.record_throughput(size, time.monotonic() - start)
+        return h.hexdigest()
 
-    def get_file(self, pathname):
+    def put_packed(self, pathname, source, chunk_size, size):
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 10)
+        h = hashlib.sha256()
+        raw_size = 0
+        with tempfile.TemporaryFile() as packed:
+            for chunk in _read_chunks(source, chunk_size):
+                h.update(chunk)
+                raw_size += len(chunk)
+                packed.write(compressor.compress(chunk))
+            packed.write(compressor.flush())
+            if size is not None and raw_size != size:
+                raise RuntimeError(f"Expected {size} bytes for '{pathname}', got {raw_size}")
+            packed_size = packed.tell()
+            packed.seek(0)
+            if raw_size - packed_size > self.compression_overhead():
+                target = pathname + self.COMPRESSED_SUFFIX
+                self.webrepl_put(target, packed, packed_size, chunk_size)
+                result, error = self.exec(self.inflate_file_script(target, pathname, chunk_size))
+                self.assert_error(error)
+                if result.decode('utf-8') != h.hexdigest():
+                    raise RuntimeError(f"Checksum mismatch after writing '{pathname}'")
+            else:
+                decompressor = zlib.decompressobj()
+                chunks = (decompressor.decompress(chunk) for chunk in _read_chunks(packed, chunk_size))
+                self.update_manifest(pathname, self.webrepl_put(pathname, chunks, raw_size, chunk_size))
+
+    @_bounded
+    @_instrumented
+    def put_stream(self, pathname, source, chunk_size=1024, *, size=None):
+        if self.can_decompress() and self.compression_overhead() is not None:
+            return self.put_packed(pathname, source, chunk_size, size)
+        if size is None:
+            size = _stream_size(source)
+        if size is None:
+            with tempfile.TemporaryFile() as spool:
+                for chunk in _read_chunks(source, chunk_size):
+                    spool.write(chunk)
+                size = spool.tell()
+                spool.seek(0)
+                return self.put_stream(pathname, spool, chunk_size, size=size)
+        self.update_manifest(pathname, self.webrepl_put(pathname, source, size, chunk_size))
+
+    @_bounded
+    @_instrumented
+    def put_file(self, pathname, content, chunk_size=1024):
+        self.put_stream(pathname, content, chunk_size=chunk_size)
+
+    def file_size(self, pathname):
+        st = self.stat_many([pathname])[0]
+        if st is None or st.isdir:
+            raise RuntimeError(f"No such file '{pathname}'")
+        return st.size
+
+    def get_blocks(self, pathname, size, window):
+        start = time.monotonic()
         self.begin_transfer(self.WEBREPL_GET_FILE, 0, pathname.encode('utf-8'))
 
-        content = b""
-        while True:
+        planned = (size + self.WEBREPL_BLOCK_SIZE - 1) // self.WEBREPL_BLOCK_SIZE + 1 if window > 1 else 1
+        requested = 0
+        while requested < min(window, planned):
             self.send_binary(b"\0")
-            tmp = self.recv()
-            (sz,) = struct.unpack("<H", tmp[:2])
+            requested += 1
+        received = 0
+        total = 0
+        while True:
+            (sz,) = struct.unpack("<H", self.recv_exactly(2))
+            received += 1
             if sz == 0:
                 break
-            buf = tmp[2:]
-            while len(buf) < sz:
-                buf += self.recv()
-            content += buf
+            block = self.recv_exactly(sz)
+            total += sz
+            if requested < planned or requested == received:
+                self.send_binary(b"\0")
+                requested += 1
+            yield block
         assert self.read_resp() == 0
-        return content
+        if requested != received:
+            raise RuntimeError(f"'{pathname}' shrank during transfer")
+        self.record_throughput(total, time.monotonic() - start)
+
+    def get_packed(self, target, size, packed_size, window):
+        decompressor = zlib.decompressobj()
+        total = 0
+        for block in self.get_blocks(target, packed_size, window):
+            data = decompressor.decompress(block)
+            total += len(data)
+            yield data
+        data = decompressor.flush()
+        total += len(data)
+        yield data
+        self.remove(target)
+        if total != size:
+            raise RuntimeError(f"Expected {size} bytes for '{target}', got {total}")
+
+    def fetch(self, pathname, chunk_size, window):
+        window = window or self.GET_WINDOW
+        overhead = self.compression_overhead()
+        if overhead is None or not self.can_compress():
+            size = self.file_size(pathname) if window > 1 else 0
+            return size, self.get_blocks(pathname, size, window)
+        target = pathname + self.COMPRESSED_SUFFIX
+        d = self.eval("d", self.deflate_file_script(pathname, target, chunk_size, overhead))
+        if d is None:
+            raise RuntimeError(f"No such file '{pathname}'")
+        size, packed_size = d
+        if packed_size is None:
+            return size, self.get_blocks(pathname, size, window)
+        return size, self.get_packed(target, size, packed_size, window)
+
+    @_bounded
+    @_instrumented
+    def get_stream(self, pathname, sink, chunk_size=1024, *, window=None):
+        size, blocks = self.fetch(pathname, chunk_size, window)
+        total = 0
+        for block in blocks:
+            sink.write(block)
+            total += len(block)
+        return total
+
+    @_bounded
+    @_instrumented
+    def get_file(self, pathname, chunk_size=1024, *, window=None):
+        size, blocks = self.fetch(pathname, chunk_size, window)
+        buffer = bytearray(size)
+        view = memoryview(buffer)
+        offset = 0
+        for block in blocks:
+            if offset + len(block) > len(buffer):
+                view.release()
+                buffer.extend(bytes(offset + len(block) - len(buffer)))
+                view = memoryview(buffer)
+            view[offset:offset+len(block)] = block
+            offset += len(block)
+        view.release()
+        del buffer[offset:]
+        return bytes(buffer)
 
 
 class SerialReplClient(BaseReplClient):
@@ -223,95 +1675,129 @@ class SerialReplClient(BaseReplClient):
     def get_timeout(self):
         return self.connection.timeout
 
-    def recv(self, sz=-1):
-        if sz == -1:
-            sz = self.connection.in_waiting
-        if sz == 0:
-            sz = 1
-        return self.connection.read(sz)
-
-    def recv_until(self, expected=b"/n"):
-        return self.connection.read_until(expected)
+    def recv_some(self):
+        tmp = self.connection.read(max(1, self.connection.in_waiting))
+        if self.instrumentation is not None:
+            self.instrumentation.record_recv(tmp)
+        return tmp
 
     def send(self, message):
-        self.connection.write(message.encode('utf-8'))
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        self.on_send(message)
+        self.connection.write(message)
 
     def send_binary(self, message):
+        self.on_send(message)
         self.connection.write(message)
 
     def pulse_dtr(self):
         self.connection.dtr = False
-        time.sleep(0.01)
+        self.sleep(0.01)
         self.connection.dtr = True
 
     def establish_connection(self, **kwargs):
-        self.pulse_dtr()
+        try:
+            self.pulse_dtr()
+        except OSError:
+            self.send(b"\x03\x03\x02\x04")
+            self.recv_until(b"soft reboot\r\n")
 
-    def send_command(self, command):
+    def send_raw_command(self, command):
         self.send(command)
         self.send("\x04")
         self.assert_recv(b"OK")
 
-    def put_file(self, pathname, content):
-        self.exec(f"f = open('{pathname}', 'wb+')")
-        chunk_size = 1024
-        for i in range(0, len(content), chunk_size):
-            chunk = content[i:i+chunk_size]
-            self.exec(f"f.write({repr(chunk)})")
-        self.exec("f.close()")
+    @_bounded
+    @_instrumented
+    def put_file(self, pathname, content, chunk_size=1024):
+        self.put_stream(pathname, content, chunk_size)
 
-    def get_file(self, pathname):
-        self.exec(f"f = open('{pathname}', 'rb')")
-        content = b""
-        chunk_size = 1024
-        chunk = self.eval(f"f.read({chunk_size})")
-        while chunk != b"":
-            content += chunk
-            chunk = self.eval(f"f.read({chunk_size})")
-        self.exec("f.close()")
-        return content
+    @_bounded
+    @_instrumented
+    def get_stream(self, pathname, sink, chunk_size=1024):
+        compress = self.can_compress()
+        self.enter_raw_repl_mode()
+        self.send_command(self.get_file_script(pathname, chunk_size, compress))
+        self.recv_ack()
+        (size,) = struct.unpack("<I", self.recv_exactly(4))
+        h = hashlib.sha256()
+        offset = 0
+        for chunk in self.recv_frames(compress):
+            h.update(chunk)
+            sink.write(chunk)
+            offset += len(chunk)
+        digest = self.recv_exactly(32)
+        result, error = self.read_response()
+        self.assert_recv(b">")
+        self.assert_error(error)
+        if offset != size or h.digest() != digest:
+            raise RuntimeError(f"Checksum mismatch after reading '{pathname}'")
+        return size
+
+    @_bounded
+    @_instrumented
+    def get_file(self, pathname, chunk_size=1024):
+        sink = io.BytesIO()
+        self.get_stream(pathname, sink, chunk_size)
+        return sink.getvalue()
 
     def configure_wifi(self, ssid, psk):
         self._import("network")
-        self.exec("sta_if = network.WLAN(network.STA_IF)")
+        self._assign("sta_if", "network.WLAN(network.STA_IF)")
 
         if not self.eval("sta_if.active()"):
             self.exec("sta_if.active(True)")
 
         if self.eval("sta_if.isconnected()") and self.eval("sta_if.config('essid')") != ssid:
-            self.exec("sta_disconnect()")
+            self.exec(self.wifi_disconnect_script())
 
         if not self.eval("sta_if.isconnected()"):
-            self.exec(f"sta_if.connect('{ssid}', '{psk}')")
+            self.exec(self.wifi_connect_script(ssid, psk))
 
         while not self.eval("sta_if.isconnected()"):
-            time.sleep(0.1)
+            self.sleep(0.1)
 
         return self.eval("sta_if.ifconfig()[0]")
 
     def configure_webrepl(self, password):
         self._import("webrepl")
-        self.exec(f"webrepl.start(password='{password}')")
+        self.exec(self.webrepl_start_script(password))
 
 
 class LocalClient:
-    def __init__(self, root):
+    HASH_CHUNK_SIZE = 1 << 20
+
+    def __init__(self, root, max_workers=None, use_manifest=False, manifest_pathname=MANIFEST_PATHNAME):
         self.root = root
+        self.manifest_pathname = manifest_pathname if use_manifest else None
+        self.max_workers = max_workers if max_workers is not None else min(32, (os.cpu_count() or 1) + 4)
+
+    def load_manifest(self):
+        try:
+            with open(self.root + self.manifest_pathname) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        with open(self.root + self.manifest_pathname, "w") as f:
+            json.dump(manifest, f)
 
     def mkdir(self, pathname):
         os.mkdir(self.root + pathname)
 
-    def isdir(self, pathname):
-        if os.path.exists(self.root + pathname):
-            return os.path.isdir(self.root + pathname)
-        else:
+    def _stat_mode(self, pathname):
+        try:
+            return os.stat(self.root + pathname).st_mode
+        except OSError:
             raise Exception()
 
+    def isdir(self, pathname):
+        return stat.S_ISDIR(self._stat_mode(pathname))
+
     def isfile(self, pathname):
-        if os.path.exists(self.root + pathname):
-            return os.path.isfile(self.root + pathname)
-        else:
-            raise Exception()
+        return stat.S_ISREG(self._stat_mode(pathname))
 
     def exists(self, pathname):
         return os.path.exists(self.root + pathname)
@@ -319,13 +1805,74 @@ class LocalClient:
     def listdir(self, pathname="/"):
         return os.listdir(self.root + pathname)
 
+    @staticmethod
+    def _file_stat(st):
+        isdir = stat.S_ISDIR(st.st_mode)
+        return FileStat(isdir, 0 if isdir else st.st_size, int(st.st_mtime))
+
+    def stat_many(self, pathnames):
+        retval = []
+        for pathname in pathnames:
+            try:
+                retval.append(self._file_stat(os.stat(self.root + pathname)))
+            except OSError:
+                retval.append(None)
+        return retval
+
+    def walk(self, root="/"):
+        retval = {}
+        directories = [root.rstrip("/")]
+        while directories:
+            directory = directories.pop()
+            with os.scandir(self.root + (directory or "/")) as entries:
+                for entry in entries:
+                    pathname = directory + "/" + entry.name
+                    retval[pathname] = self._file_stat(entry.stat())
+                    if entry.is_dir():
+                        directories.append(pathname)
+        retval.pop(self.manifest_pathname, None)
+        return retval
+
+    def update_manifest(self, pathname, hexdigest):
+        if self.manifest_pathname is not None:
+            manifest = self.load_manifest()
+            st = os.stat(self.root + pathname)
+            manifest[pathname] = [st.st_size, st.st_mtime_ns, hexdigest]
+            self.save_manifest(manifest)
+
+    def put_stream(self, pathname, source, chunk_size=65536):
+        h = hashlib.sha256()
+        with open(self.root + pathname, "wb") as f:
+            for chunk in _read_chunks(source, chunk_size):
+                f.write(chunk)
+                h.update(chunk)
+        self.update_manifest(pathname, h.hexdigest())
+
     def put_file(self, pathname, content):
-        with open(self.root + pathname, "wb+") as f:
-            f.write(content)
+        self.put_stream(pathname, content)
 
-    def get_file(self, pathname):
+    def get_stream(self, pathname, sink, chunk_size=65536):
         with open(self.root + pathname, "rb") as f:
-            return f.read()
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m, memoryview(m) as view:
+                for i in range(0, size, chunk_size):
+                    sink.write(view[i:i+chunk_size])
+        return size
+
+    def get_file(self, pathname, chunk_size=65536):
+        sink = io.BytesIO()
+        self.get_stream(pathname, sink, chunk_size)
+        return sink.getvalue()
+
+    def put_tree(self, files):
+        for pathname in sorted(files):
+            os.makedirs(os.path.dirname(self.root + pathname), exist_ok=True)
+            self.put_file(pathname, files[pathname])
+
+    def get_tree(self, pathnames):
+        return {pathname: self.get_file(pathname) for pathname in pathnames}
 
     def remove(self, pathname):
         if os.path.exists(self.root + pathname):
@@ -333,41 +1880,102 @@ class LocalClient:
                 shutil.rmtree(self.root + pathname)
             else:
                 os.remove(self.root + pathname)
+        if self.manifest_pathname is not None:
+            manifest = self.load_manifest()
+            stale = [p for p in manifest if p == pathname or p.startswith(pathname + "/")]
+            if stale:
+                for p in stale:
+                    del manifest[p]
+                self.save_manifest(manifest)
+
+    def _sha256(self, pathname):
+        with open(self.root + pathname, "rb") as f:
+            if hasattr(hashlib, "file_digest"):
+                return hashlib.file_digest(f, "sha256").digest()
+            h = hashlib.sha256()
+            for chunk in _read_chunks(f, self.HASH_CHUNK_SIZE):
+                h.update(chunk)
+            return h.digest()
+
+    def _sha256_parallel(self, pathnames):
+        if len(pathnames) < 2 or self.max_workers < 2:
+            return [self._sha256(pathname) for pathname in pathnames]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(pathnames))) as executor:
+            return list(executor.map(self._sha256, pathnames))
 
     def sha256(self, pathname):
-        h = hashlib.sha256()
-        with open(self.root + pathname, "rb") as f:
-            h.update(f.read())
-        return h.digest()
+        return self.sha256_many([pathname])[0]
+
+    def sha256_many(self, pathnames):
+        if self.manifest_pathname is None:
+            return self._sha256_parallel(pathnames)
+        manifest = self.load_manifest()
+        stale = {}
+        for pathname in pathnames:
+            st = os.stat(self.root + pathname)
+            entry = manifest.get(pathname)
+            if entry is None or entry[0] != st.st_size or entry[1] != st.st_mtime_ns:
+                stale[pathname] = st
+        if stale:
+            for pathname, digest in zip(stale, self._sha256_parallel(list(stale))):
+                st = stale[pathname]
+                manifest[pathname] = [st.st_size, st.st_mtime_ns, digest.hex()]
+            self.save_manifest(manifest)
+        return [bytes.fromhex(manifest[pathname][2]) for pathname in pathnames]
+
+    def snapshot(self, root="/"):
+        tree = self.walk(root)
+        files = [pathname for pathname in sorted(tree) if not tree[pathname].isdir]
+        digests = dict(zip(files, self.sha256_many(files)))
+        return {pathname: SnapshotEntry(tree[pathname], digests.get(pathname)) for pathname in tree}
 
     def close(self):
         pass
 
 
 class EndpointFactory:
+    def __init__(self, attach=False, use_manifest=False, timeout=None, operation_timeout=None):
+        self.attach = attach
+        self.use_manifest = use_manifest
+        self.timeout = timeout
+        self.operation_timeout = operation_timeout
+
     @staticmethod
     def _build_local_endpoint(name):
         return LocalClient(name)
 
-    @staticmethod
-    def _build_serial_endpoint(name, baud):
-        connection = serial.Serial(name, baud)
-        return SerialReplClient(connection)
+    def _build_serial_endpoint(self, name, baud, attach=False):
+        import serial
+        connection = serial.Serial(name, baud, timeout=self.timeout)
+        return SerialReplClient(connection, attach=attach, operation_timeout=self.operation_timeout)
 
-    @staticmethod
-    def _build_websocket_endpoint(name, password):
+    def _build_websocket_endpoint(self, name, password, attach=False):
+        import websocket
         connection = websocket.WebSocket()
+        connection.settimeout(self.timeout)
         connection.connect(name)
-        return WebReplClient(connection, password=password)
+        return WebReplClient(connection, password=password, attach=attach, operation_timeout=self.operation_timeout)
+
+    def _parse_attach(self, args):
+        if args and (args[0] == '-a' or args[0] == '--attach'):
+            args.pop(0)
+            return True
+        return self.attach
 
     def build_endpoint(self, name, args):
+        endpoint = self._build_endpoint(name, args)
+        if self.use_manifest:
+            endpoint.manifest_pathname = MANIFEST_PATHNAME
+        return endpoint
+
+    def _build_endpoint(self, name, args):
         if name.startswith("ws://"):
             password = None
             if len(args) > 1 and (args[0] == '-p' or args[0] == '--password'):
                 args.pop(0)
                 password = args.pop(0)
             if password is not None:
-                return self._build_websocket_endpoint(name, password)
+                return self._build_websocket_endpoint(name, password, self._parse_attach(args))
             else:
                 raise RuntimeError(f"Websocket endpoint '{name}' missing password")
         elif name.startswith("/dev"):
@@ -375,9 +1983,264 @@ class EndpointFactory:
             if len(args) > 1 and (args[0] == '-b' or args[0] == '--baud'):
                 args.pop(0)
                 baud = int(args.pop(0))
-            return self._build_serial_endpoint(name, baud)
+            return self._build_serial_endpoint(name, baud, self._parse_attach(args))
         else:
             if os.path.isdir(name):
                 return self._build_local_endpoint(name)
             else:
                 raise RuntimeError(f"Local endpoint '{name}' is not a directory")
+
+    def release(self, endpoint):
+        endpoint.close()
+
+
+class PooledEndpointFactory(EndpointFactory):
+    def __init__(self, max_idle=300.0, probe_timeout=1.0, attach=False, use_manifest=False, timeout=None,
+                 operation_timeout=None):
+        super().__init__(attach, use_manifest, timeout, operation_timeout)
+        self.max_idle = max_idle
+        self.probe_timeout = probe_timeout
+        self.pool = {}
+        self.checked_out = {}
+        self.lock = threading.Lock()
+        self.released = threading.Condition(self.lock)
+
+    def is_alive(self, endpoint):
+        try:
+            if isinstance(endpoint, LocalClient):
+                return os.path.isdir(endpoint.root)
+            return endpoint.with_timeout(self.probe_timeout, lambda: endpoint.eval("1")) == 1
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(endpoint):
+        try:
+            endpoint.close()
+        except Exception:
+            pass
+
+    def expire(self):
+        now = time.monotonic()
+        with self.lock:
+            expired = [key for key, (endpoint, last_used) in self.pool.items() if now - last_used > self.max_idle]
+            endpoints = [self.pool.pop(key)[0] for key in expired]
+        for endpoint in endpoints:
+            self._close(endpoint)
+
+    def _pooled(self, key, build):
+        self.expire()
+        with self.released:
+            while key in self.checked_out:
+                self.released.wait()
+            entry = self.pool.pop(key, None)
+            self.checked_out[key] = None
+        try:
+            if entry is not None and self.is_alive(entry[0]):
+                endpoint = entry[0]
+            else:
+                if entry is not None:
+                    self._close(entry[0])
+                endpoint = build()
+        except BaseException:
+            with self.released:
+                del self.checked_out[key]
+                self.released.notify_all()
+            raise
+        with self.lock:
+            self.checked_out[key] = endpoint
+        return endpoint
+
+    def release(self, endpoint):
+        with self.released:
+            keys = [key for key, checked_out in self.checked_out.items() if checked_out is endpoint]
+            if not keys:
+                raise RuntimeError("Endpoint is not checked out of this pool")
+            del self.checked_out[keys[0]]
+            self.pool[keys[0]] = [endpoint, time.monotonic()]
+            self.released.notify_all()
+
+    def _build_local_endpoint(self, name):
+        return self._pooled(("local", name), lambda: EndpointFactory._build_local_endpoint(name))
+
+    def _build_serial_endpoint(self, name, baud, attach=False):
+        build = super()._build_serial_endpoint
+        return self._pooled(("serial", name, baud), lambda: build(name, baud, attach))
+
+    def _build_websocket_endpoint(self, name, password, attach=False):
+        build = super()._build_websocket_endpoint
+        return self._pooled(("websocket", name, password), lambda: build(name, password, attach))
+
+    def close(self):
+        with self.lock:
+            endpoints = [endpoint for endpoint, last_used in self.pool.values()]
+            self.pool.clear()
+        for endpoint in endpoints:
+            self._close(endpoint)
+
+
+class SnapshotClient:
+    def __init__(self, src):
+        if hasattr(src, "snapshot"):
+            entries = src.snapshot()
+        else:
+            tree = src.walk()
+            files = [pathname for pathname in sorted(tree) if not tree[pathname].isdir]
+            digests = dict(zip(files, src.sha256_many(files)))
+            entries = {pathname: SnapshotEntry(tree[pathname], digests.get(pathname)) for pathname in tree}
+        self.src = src
+        self.entries = entries
+        self.contents = {}
+        self.lock = threading.Lock()
+
+    def walk(self, root="/"):
+        prefix = root.rstrip("/") + "/"
+        return {pathname: entry.stat for pathname, entry in self.entries.items() if pathname.startswith(prefix)}
+
+    def sha256(self, pathname):
+        return self.entries[pathname].sha256
+
+    def sha256_many(self, pathnames):
+        return [self.entries[pathname].sha256 for pathname in pathnames]
+
+    def get_file(self, pathname):
+        with self.lock:
+            if pathname not in self.contents:
+                self.contents[pathname] = self.src.get_file(pathname)
+            return self.contents[pathname]
+
+    def get_tree(self, pathnames):
+        return {pathname: self.get_file(pathname) for pathname in pathnames}
+
+    def close(self):
+        pass
+
+
+def _remove_tree(endpoint, tree, pathname, removed):
+    for child in sorted((p for p in tree if p.startswith(pathname + "/")), reverse=True):
+        endpoint.remove(child)
+        removed.append(child)
+    endpoint.remove(pathname)
+    removed.append(pathname)
+
+
+def sync(src, dst, delete=False, delta_threshold=4096):
+    src_tree = src.walk()
+    dst_tree = dst.walk()
+    result = SyncResult([], [], [])
+
+    for pathname in sorted(src_tree):
+        src_stat = src_tree[pathname]
+        dst_stat = dst_tree.get(pathname)
+        if dst_stat is not None and dst_stat.isdir != src_stat.isdir:
+            _remove_tree(dst, dst_tree, pathname, result.removed)
+            dst_stat = None
+        if src_stat.isdir and dst_stat is None:
+            dst.mkdir(pathname)
+            result.created.append(pathname)
+
+    candidates = [p for p in sorted(src_tree) if not src_tree[p].isdir]
+    same_size = [p for p in candidates
+                 if p in dst_tree and not dst_tree[p].isdir and dst_tree[p].size == src_tree[p].size
+                 and p not in result.removed]
+    unchanged = set()
+    if same_size:
+        for pathname, src_digest, dst_digest in zip(same_size, src.sha256_many(same_size), dst.sha256_many(same_size)):
+            if src_digest == dst_digest:
+                unchanged.add(pathname)
+
+    small = []
+    for pathname in candidates:
+        if pathname not in unchanged:
+            dst_stat = dst_tree.get(pathname)
+            if src_tree[pathname].size < delta_threshold:
+                small.append(pathname)
+            elif isinstance(dst, BaseReplClient) and dst_stat is not None and not dst_stat.isdir \
+                    and pathname not in result.removed:
+                dst.put_file_delta(pathname, src.get_file(pathname))
+            else:
+                dst.put_file(pathname, src.get_file(pathname))
+            result.copied.append(pathname)
+    if small:
+        dst.put_tree(src.get_tree(small))
+
+    if delete:
+        for pathname in sorted(dst_tree, reverse=True):
+            if pathname not in src_tree and pathname not in result.removed:
+                dst.remove(pathname)
+                result.removed.append(pathname)
+
+    return result
+
+
+class Fleet:
+    def __init__(self, specs, max_workers=8, endpoint_factory=None):
+        self.specs = []
+        for name, args in [(spec, []) if isinstance(spec, str) else (spec[0], list(spec[1])) for spec in specs]:
+            # one endpoint per name: a second checkout of the same device would deadlock or reopen the port
+            existing = next((existing for existing in self.specs if existing[0] == name), None)
+            if existing is None:
+                self.specs.append((name, args))
+            elif existing[1] != args:
+                raise RuntimeError(f"Conflicting arguments for {name}: {existing[1]} and {args}")
+        self.max_workers = max_workers
+        self.endpoint_factory = endpoint_factory if endpoint_factory is not None else EndpointFactory()
+        self.endpoints = {}
+        self.failures = {}
+
+    @staticmethod
+    def _timed(name, callback):
+        t0 = time.monotonic()
+        try:
+            return FleetResult(name, callback(), None, time.monotonic() - t0)
+        except Exception as e:
+            return FleetResult(name, None, e, time.monotonic() - t0)
+
+    def _map(self, callback, items):
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(callback, items))
+
+    def connect(self):
+        pending = [spec for spec in self.specs if spec[0] not in self.endpoints]
+        results = self._map(
+            lambda spec: self._timed(spec[0], lambda: self.endpoint_factory.build_endpoint(spec[0], list(spec[1]))),
+            pending)
+        for result in results:
+            if result.error is None:
+                self.endpoints[result.name] = result.result
+                self.failures.pop(result.name, None)
+            else:
+                self.failures[result.name] = result
+        return results
+
+    def run(self, operation):
+        self.connect()
+        results = self._map(lambda name: self._timed(name, lambda: operation(self.endpoints[name])),
+                            [name for name, args in self.specs if name in self.endpoints])
+        results = {result.name: result for result in results}
+        return [results[name] if name in results else self.failures[name] for name, args in self.specs]
+
+    def exec(self, command):
+        return self.run(lambda endpoint: endpoint.exec(command))
+
+    def eval(self, expression):
+        return self.run(lambda endpoint: endpoint.eval(expression))
+
+    def put_file(self, pathname, content):
+        return self.run(lambda endpoint: endpoint.put_file(pathname, content))
+
+    def sync(self, src, delete=False):
+        snapshot = SnapshotClient(src)
+        return self.run(lambda endpoint: sync(snapshot, endpoint, delete))
+
+    def close(self):
+        self._map(self.endpoint_factory.release, list(self.endpoints.values()))
+        self.endpoints.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
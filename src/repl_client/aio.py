@@ -0,0 +1,522 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import struct
+from urllib.parse import urlparse
+
+import serial
+import websocket
+
+from . import MANIFEST_PATHNAME, ReplProtocol, FileStat
+
+
+class AsyncConnection:
+    def __init__(self):
+        self.buffer = bytearray()
+        self.data_received = asyncio.Event()
+        self.closed = False
+
+    def feed_data(self, data):
+        self.buffer += data
+        self.data_received.set()
+
+    def feed_eof(self):
+        self.closed = True
+        self.data_received.set()
+
+    async def wait_for_data(self):
+        self.data_received.clear()
+        await self.data_received.wait()
+
+
+class AsyncSerialConnection(AsyncConnection):
+    def __init__(self, connection):
+        super().__init__()
+        self.connection = connection
+        self.fd = connection.fileno()
+        self.loop = asyncio.get_running_loop()
+        self.loop.add_reader(self.fd, self.read_ready)
+
+    def read_ready(self):
+        try:
+            data = os.read(self.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if data:
+            self.feed_data(data)
+        else:
+            self.loop.remove_reader(self.fd)
+            self.feed_eof()
+
+    async def write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except BlockingIOError:
+                writable = self.loop.create_future()
+                self.loop.add_writer(self.fd, lambda: writable.done() or writable.set_result(None))
+                try:
+                    await writable
+                finally:
+                    self.loop.remove_writer(self.fd)
+
+    def close(self):
+        self.loop.remove_reader(self.fd)
+        self.connection.close()
+
+
+class AsyncWebSocketConnection(AsyncConnection):
+    def __init__(self, reader, writer):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.task = asyncio.get_running_loop().create_task(self.receive_frames())
+
+    @classmethod
+    async def connect(cls, url):
+        parts = urlparse(url)
+        reader, writer = await asyncio.open_connection(parts.hostname, parts.port or 80)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        writer.write((f"GET {parts.path or '/'} HTTP/1.1\r\n"
+                      f"Host: {parts.netloc}\r\n"
+                      "Upgrade: websocket\r\n"
+                      "Connection: Upgrade\r\n"
+                      f"Sec-WebSocket-Key: {key}\r\n"
+                      "Sec-WebSocket-Version: 13\r\n"
+                      "\r\n").encode('ascii'))
+        await writer.drain()
+        response = await reader.readuntil(b"\r\n\r\n")
+        if response.split(b" ", 2)[1] != b"101":
+            writer.close()
+            raise RuntimeError(f"Websocket endpoint '{url}' refused the upgrade")
+        return cls(reader, writer)
+
+    async def receive_frames(self):
+        try:
+            while True:
+                header = await self.reader.readexactly(2)
+                opcode = header[0] & 0x0f
+                length = header[1] & 0x7f
+                if length == 126:
+                    (length,) = struct.unpack("!H", await self.reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack("!Q", await self.reader.readexactly(8))
+                mask = await self.reader.readexactly(4) if header[1] & 0x80 else None
+                payload = await self.reader.readexactly(length)
+                if mask is not None:
+                    payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+                if opcode in (websocket.ABNF.OPCODE_TEXT, websocket.ABNF.OPCODE_BINARY, websocket.ABNF.OPCODE_CONT):
+                    self.feed_data(payload)
+                elif opcode == websocket.ABNF.OPCODE_PING:
+                    await self.send_frame(payload, websocket.ABNF.OPCODE_PONG)
+                elif opcode == websocket.ABNF.OPCODE_CLOSE:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        self.feed_eof()
+
+    async def send_frame(self, data, opcode):
+        self.writer.write(websocket.ABNF.create_frame(bytes(data), opcode).format())
+        await self.writer.drain()
+
+    async def write(self, data):
+        await self.send_frame(data, websocket.ABNF.OPCODE_TEXT)
+
+    async def write_binary(self, data):
+        await self.send_frame(data, websocket.ABNF.OPCODE_BINARY)
+
+    def close(self):
+        self.task.cancel()
+        self.writer.close()
+
+
+# Shares scripts and response parsing with the blocking clients through ReplProtocol. Not ported yet:
+# compression, the agent, delta and tree transfers, operation deadlines, attach, windowed WebREPL gets
+# and instrumentation.
+class AsyncBaseReplClient(ReplProtocol):
+    def __init__(self, connection, use_manifest=False, manifest_pathname=MANIFEST_PATHNAME):
+        self.connection = connection
+        self.timeout = None
+        self.in_raw_repl_mode = False
+        self.use_raw_paste_mode = True
+        self.session = set()
+        self.manifest_pathname = manifest_pathname if use_manifest else None
+
+    @classmethod
+    async def create(cls, connection, use_manifest=False, manifest_pathname=MANIFEST_PATHNAME, **kwargs):
+        client = cls(connection, use_manifest, manifest_pathname)
+        await client.establish_connection(**kwargs)
+        await client.recv_until(b">>> ")
+        return client
+
+    async def _import(self, module_name):
+        if module_name not in self.session:
+            result, error = await self.exec(f"import {module_name}")
+            if error == b"":
+                self.session.add(module_name)
+
+    async def _assign(self, name, expression):
+        if name not in self.session:
+            result, error = await self.exec(f"{name} = {expression}")
+            self.assert_error(error)
+            self.session.add(name)
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def get_timeout(self):
+        return self.timeout
+
+    async def with_timeout(self, timeout, callback):
+        previous_timeout = self.get_timeout()
+        self.set_timeout(timeout)
+        try:
+            return await callback()
+        finally:
+            self.set_timeout(previous_timeout)
+
+    async def assert_recv(self, expected):
+        actual = await self.recv(len(expected))
+        if actual != expected:
+            print()
+            print('---')
+            print(f"E: '{expected}'")
+            print(f"A: '{actual}'")
+            print('---')
+            raise Exception()
+
+    async def recv(self, sz=-1):
+        buffer = self.connection.buffer
+        if not buffer and not self.connection.closed:
+            try:
+                await asyncio.wait_for(self.connection.wait_for_data(), self.timeout)
+            except asyncio.TimeoutError:
+                return b""
+        if sz == -1 or sz > len(buffer):
+            sz = len(buffer)
+        data = bytes(buffer[:sz])
+        del buffer[:sz]
+        return data
+
+    async def recv_until(self, expected=b"\n"):
+        buffer = self.connection.buffer
+        loop = asyncio.get_running_loop()
+        deadline = None if self.timeout is None else loop.time() + self.timeout
+        start = 0
+        while True:
+            i = buffer.find(expected, start)
+            if i >= 0:
+                data = bytes(buffer[:i + len(expected)])
+                del buffer[:i + len(expected)]
+                return data
+            start = max(0, len(buffer) - len(expected) + 1)
+            remaining = None if deadline is None else deadline - loop.time()
+            if self.connection.closed or (remaining is not None and remaining <= 0):
+                break
+            try:
+                await asyncio.wait_for(self.connection.wait_for_data(), remaining)
+            except asyncio.TimeoutError:
+                break
+        data = bytes(buffer)
+        buffer.clear()
+        return data
+
+    async def recv_exactly(self, sz):
+        buf = b""
+        while len(buf) < sz:
+            tmp = await self.recv(sz - len(buf))
+            if tmp == b"":
+                break
+            buf += tmp
+        return buf
+
+    async def send(self, message):
+        if isinstance(message, str):
+            message = message.encode('utf-8')
+        await self.connection.write(message)
+
+    async def enter_raw_repl_mode(self):
+        if not self.in_raw_repl_mode:
+            await self.send("\x01")
+            await self.recv_until(b">")
+            self.in_raw_repl_mode = True
+
+    async def enter_repl_mode(self):
+        if self.in_raw_repl_mode:
+            await self.send("\x02")
+            await self.recv_until(b">>> ")
+            self.in_raw_repl_mode = False
+            self.session.clear()
+
+    async def soft_reset(self):
+        await self.enter_raw_repl_mode()
+        await self.send("\x04")
+        await self.recv_until(b"raw REPL; CTRL-B to exit\r\n>")
+        self.session.clear()
+
+    async def enter_raw_paste_mode(self):
+        await self.send(b"\x05A\x01")
+        response = await self.recv_exactly(2)
+        if response == b"R\x01":
+            return True
+        if response != b"R\x00":
+            await self.recv_until(b"w REPL; CTRL-B to exit\r\n>")
+        self.use_raw_paste_mode = False
+        return False
+
+    async def send_raw_paste_command(self, command):
+        data = command.encode('utf-8')
+        (window_size,) = struct.unpack("<H", await self.recv_exactly(2))
+        window_remaining = window_size
+        i = 0
+        while i < len(data):
+            while window_remaining == 0:
+                flow = await self.recv_exactly(1)
+                if flow == b"\x01":
+                    window_remaining += window_size
+                elif flow == b"\x04":
+                    await self.send(b"\x04")
+                    return
+                else:
+                    raise RuntimeError(f"Unexpected raw paste flow control byte {flow}")
+            chunk = data[i:i+window_remaining]
+            await self.send(chunk)
+            window_remaining -= len(chunk)
+            i += len(chunk)
+        await self.send(b"\x04")
+        await self.recv_until(b"\x04")
+
+    async def send_command(self, command):
+        if self.use_raw_paste_mode and await self.enter_raw_paste_mode():
+            await self.send_raw_paste_command(command)
+        else:
+            await self.send_raw_command(command)
+
+    async def read_response_part(self):
+        return self.response_part(await self.recv_until(b"\x04"))
+
+    async def read_response(self):
+        result = await self.read_response_part()
+        error = await self.read_response_part()
+
+        return result, error
+
+    async def exec(self, command):
+        await self.enter_raw_repl_mode()
+        await self.send_command(command)
+        result, error = await self.read_response()
+        await self.assert_recv(b">")
+        if error != b"":
+            self.session.clear()
+        return result, error
+
+    async def eval(self, expression, setup=""):
+        result, error = await self.exec(f"{setup}print(repr({expression}), end='')")
+        return self.eval_result(result, error)
+
+    async def update_manifest(self, pathname, hexdigest):
+        if self.manifest_pathname is not None:
+            result, error = await self.exec(self.update_manifest_script(pathname, hexdigest))
+            self.assert_error(error)
+
+    async def remove(self, pathname):
+        await self._import("uos")
+        result, error = await self.exec(self.remove_script(pathname))
+        self.assert_error(error)
+        return result
+
+    async def sha256(self, pathname, chunk_size=1024):
+        return (await self.sha256_many([pathname], chunk_size))[0]
+
+    async def sha256_many(self, pathnames, chunk_size=1024):
+        return await self.eval("d", self.sha256_many_script(pathnames, chunk_size))
+
+    async def mkdir(self, pathname):
+        await self._import("uos")
+        result, error = await self.exec(f"uos.mkdir({repr(pathname)})")
+        self.assert_error(error)
+        return result
+
+    async def isfile(self, pathname):
+        await self._import("uos")
+        return await self.eval(f"(uos.stat({repr(pathname)})[0] & 32768) == 32768")
+
+    async def isdir(self, pathname):
+        await self._import("uos")
+        return await self.eval(f"(uos.stat({repr(pathname)})[0] & 16384) == 16384")
+
+    async def exists(self, pathname):
+        return (await self.stat_many([pathname]))[0] is not None
+
+    async def listdir(self, pathname='/'):
+        await self._import("uos")
+        return await self.eval(f"uos.listdir({repr(pathname)})")
+
+    async def stat_many(self, pathnames):
+        return [None if s is None else FileStat(*s) for s in await self.eval("d", self.stat_many_script(pathnames))]
+
+    async def walk(self, root='/'):
+        tree = {p: FileStat(*s) for p, s in (await self.eval("d", self.walk_script(root))).items()}
+        tree.pop(self.manifest_pathname, None)
+        return tree
+
+    async def close(self):
+        await self.enter_repl_mode()
+        self.session.clear()
+        self.connection.close()
+
+
+class AsyncWebReplClient(AsyncBaseReplClient):
+    WEBREPL_REQ_S = "<2sBBQLH64s"
+    WEBREPL_PUT_FILE = 1
+    WEBREPL_GET_FILE = 2
+    WEBREPL_GET_VER = 3
+
+    async def send_binary(self, message):
+        await self.connection.write_binary(message)
+
+    async def establish_connection(self, **kwargs):
+        await self.assert_recv(b"Password: ")
+        await self.send(kwargs['password'])
+        await self.send("\r\n")
+
+    async def send_raw_command(self, command):
+        chunk_size = 128
+        for i in range(0, len(command), chunk_size):
+            chunk = command[i:i+chunk_size]
+            await self.send(chunk)
+            if i + chunk_size < len(command):
+                await asyncio.sleep(0.3)
+        await self.send("\x04")
+        await self.assert_recv(b"OK")
+
+    async def read_resp(self):
+        return self.webrepl_response_code(await self.recv_exactly(4))
+
+    async def begin_transfer(self, opcode, sz, b_pathname):
+        await self.enter_repl_mode()
+        await self.send_binary(self.webrepl_request(opcode, sz, b_pathname))
+        assert await self.read_resp() == 0
+
+    async def put_file(self, pathname, content):
+        await self.begin_transfer(self.WEBREPL_PUT_FILE, len(content), pathname.encode('utf-8'))
+
+        chunk_size = 1024
+        for i in range(0, len(content), chunk_size):
+            chunk = content[i:i+chunk_size]
+            await self.send_binary(chunk)
+        assert await self.read_resp() == 0
+        await self.update_manifest(pathname, hashlib.sha256(content).hexdigest())
+
+    async def get_file(self, pathname):
+        await self.begin_transfer(self.WEBREPL_GET_FILE, 0, pathname.encode('utf-8'))
+
+        content = bytearray()
+        while True:
+            await self.send_binary(b"\0")
+            (sz,) = struct.unpack("<H", await self.recv_exactly(2))
+            if sz == 0:
+                break
+            content += await self.recv_exactly(sz)
+        assert await self.read_resp() == 0
+        return bytes(content)
+
+
+class AsyncSerialReplClient(AsyncBaseReplClient):
+    async def pulse_dtr(self):
+        self.connection.connection.dtr = False
+        await asyncio.sleep(0.01)
+        self.connection.connection.dtr = True
+
+    async def establish_connection(self, **kwargs):
+        try:
+            await self.pulse_dtr()
+        except OSError:
+            await self.send(b"\x03\x03\x02\x04")
+            await self.recv_until(b"soft reboot\r\n")
+
+    async def send_raw_command(self, command):
+        await self.send(command)
+        await self.send("\x04")
+        await self.assert_recv(b"OK")
+
+    async def recv_ack(self):
+        ack = await self.recv_exactly(1)
+        if ack == b"\x06":
+            return
+        if ack == b"\x04":
+            error = await self.read_response_part()
+            await self.assert_recv(b">")
+            self.assert_error(error)
+        raise RuntimeError(f"Expected acknowledgement from device, got {ack}")
+
+    async def put_file(self, pathname, content, chunk_size=1024):
+        await self.enter_raw_repl_mode()
+        await self.send_command(self.put_file_script(pathname))
+        for i in range(0, len(content), chunk_size):
+            await self.recv_ack()
+            await self.send(binascii.b2a_base64(content[i:i+chunk_size]))
+        await self.recv_ack()
+        await self.send(b"\n")
+        result, error = await self.read_response()
+        await self.assert_recv(b">")
+        self.assert_error(error)
+        if result.decode('utf-8') != hashlib.sha256(content).hexdigest():
+            raise RuntimeError(f"Checksum mismatch after writing '{pathname}'")
+
+    async def get_file(self, pathname, chunk_size=1024):
+        await self.enter_raw_repl_mode()
+        await self.send_command(self.get_file_script(pathname, chunk_size))
+        await self.recv_ack()
+        (size,) = struct.unpack("<I", await self.recv_exactly(4))
+        content = bytearray(size)
+        view = memoryview(content)
+        offset = 0
+        while True:
+            (sz,) = struct.unpack("<H", await self.recv_exactly(2))
+            if sz == 0:
+                break
+            view[offset:offset+sz] = await self.recv_exactly(sz)
+            offset += sz
+        digest = await self.recv_exactly(32)
+        result, error = await self.read_response()
+        await self.assert_recv(b">")
+        self.assert_error(error)
+        if offset != size or hashlib.sha256(content).digest() != digest:
+            raise RuntimeError(f"Checksum mismatch after reading '{pathname}'")
+        return bytes(content)
+
+    async def configure_wifi(self, ssid, psk):
+        await self._import("network")
+        await self._assign("sta_if", "network.WLAN(network.STA_IF)")
+
+        if not await self.eval("sta_if.active()"):
+            await self.exec("sta_if.active(True)")
+
+        if await self.eval("sta_if.isconnected()") and await self.eval("sta_if.config('essid')") != ssid:
+            await self.exec(self.wifi_disconnect_script())
+
+        if not await self.eval("sta_if.isconnected()"):
+            await self.exec(self.wifi_connect_script(ssid, psk))
+
+        while not await self.eval("sta_if.isconnected()"):
+            await asyncio.sleep(0.1)
+
+        return await self.eval("sta_if.ifconfig()[0]")
+
+    async def configure_webrepl(self, password):
+        await self._import("webrepl")
+        await self.exec(self.webrepl_start_script(password))
+
+
+async def connect_serial(name, baud=115200):
+    return await AsyncSerialReplClient.create(AsyncSerialConnection(serial.Serial(name, baud)))
+
+
+async def connect_websocket(name, password):
+    return await AsyncWebReplClient.create(await AsyncWebSocketConnection.connect(name), password=password)
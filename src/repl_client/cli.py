@@ -0,0 +1,262 @@
+import io
+import json
+import os
+import sys
+import tempfile
+
+from . import EndpointFactory, LocalClient, PooledEndpointFactory, sync
+
+USAGE = """usage: repl-client [--socket PATH | --no-daemon] [--timeout SECONDS]
+                   ENDPOINT [ENDPOINT OPTIONS] COMMAND [ARGS...]
+       repl-client [--socket PATH] [--timeout SECONDS] daemon
+
+endpoints:
+  /dev/ttyACM0 [-b BAUD] [-a]     a serial port
+  ws://HOST:8266/ -p PASSWORD [-a]
+                                  a WebREPL
+  DIRECTORY                       a local directory
+
+  -a, --attach                    attach to the running board instead of resetting it
+
+commands:
+  ls [PATH]                       list a directory
+  cp SRC DST                      copy a file, prefix device paths with ':'
+  rm PATH...                      remove files or directories
+  exec CODE                       run CODE ('-' reads it from stdin) in the raw REPL
+  sha256 PATH...                  print sha256 digests
+  sync DIRECTORY [--delete]       make the endpoint match a local directory
+
+--timeout bounds every read and device operation (default 10 seconds, 0 waits forever). Forwarded
+commands use the daemon's timeout.
+
+If a daemon is listening on the socket, commands are forwarded to it and reuse its open connections.
+"""
+
+DEFAULT_TIMEOUT = 10.0
+
+
+def default_socket_path():
+    directory = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(directory, f"repl-client-{os.getuid()}.sock")
+
+
+class UsageError(Exception):
+    pass
+
+
+def _ls(endpoint, args, out, cwd):
+    for name in sorted(endpoint.listdir(args[0] if args else "/")):
+        out.write(name + "\n")
+    return 0
+
+
+def _cp(endpoint, args, out, cwd):
+    if len(args) != 2 or args[0].startswith(":") == args[1].startswith(":"):
+        raise UsageError("cp needs exactly one device path, prefixed with ':'")
+    src, dst = args
+    if src.startswith(":"):
+        local = os.path.join(cwd, dst)
+        if os.path.isdir(local):
+            local = os.path.join(local, os.path.basename(src[1:]))
+        with open(local, "wb") as f:
+            endpoint.get_stream(src[1:], f)
+    else:
+        remote = dst[1:] or "/"
+        if remote.endswith("/"):
+            remote += os.path.basename(src)
+        with open(os.path.join(cwd, src), "rb") as f:
+            endpoint.put_file(remote, f.read())
+    return 0
+
+
+def _rm(endpoint, args, out, cwd):
+    for pathname in args:
+        endpoint.remove(pathname)
+    return 0
+
+
+def _exec(endpoint, args, out, cwd):
+    if len(args) != 1:
+        raise UsageError("exec needs exactly one argument")
+    result, error = endpoint.exec(args[0])
+    out.write(result.decode('utf-8', 'replace').replace("\r\n", "\n"))
+    if error != b"":
+        raise RuntimeError(error.decode('utf-8', 'replace').replace("\r\n", "\n").strip())
+    return 0
+
+
+def _sha256(endpoint, args, out, cwd):
+    for pathname, digest in zip(args, endpoint.sha256_many(args)):
+        out.write(f"{digest.hex()}  {pathname}\n")
+    return 0
+
+
+def _sync(endpoint, args, out, cwd):
+    delete = "--delete" in args
+    args = [arg for arg in args if arg != "--delete"]
+    if len(args) != 1:
+        raise UsageError("sync needs exactly one local directory")
+    result = sync(LocalClient(os.path.join(cwd, args[0]).rstrip("/")), endpoint, delete)
+    for action, pathnames in zip(("created", "copied", "removed"), result):
+        for pathname in pathnames:
+            out.write(f"{action} {pathname}\n")
+    return 0
+
+
+COMMANDS = {
+    "ls": _ls,
+    "cp": _cp,
+    "rm": _rm,
+    "exec": _exec,
+    "sha256": _sha256,
+    "sync": _sync,
+}
+
+
+def run(argv, endpoint_factory, out, err, cwd):
+    args = list(argv)
+    if not args:
+        err.write(USAGE)
+        return 2
+    name = args.pop(0)
+    if not name.startswith("ws://") and not name.startswith("/dev"):
+        name = os.path.join(cwd, name)
+    try:
+        endpoint = endpoint_factory.build_endpoint(name, args)
+    except Exception as e:
+        err.write(f"repl-client: {e}\n")
+        return 1
+    try:
+        if not args or args[0] not in COMMANDS:
+            raise UsageError(f"unknown command '{args[0]}'" if args else "missing command")
+        return COMMANDS[args[0]](endpoint, args[1:], out, cwd)
+    except UsageError as e:
+        err.write(f"repl-client: {e}\n{USAGE}")
+        return 2
+    except Exception as e:
+        err.write(f"repl-client: {str(e) or type(e).__name__}\n")
+        return 1
+    finally:
+        endpoint_factory.release(endpoint)
+
+
+def make_server(socket_path, endpoint_factory=None, timeout=DEFAULT_TIMEOUT):
+    import socketserver
+
+    if endpoint_factory is None:
+        endpoint_factory = PooledEndpointFactory(timeout=timeout, operation_timeout=timeout)
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            out = io.StringIO()
+            err = io.StringIO()
+            status = run(request["argv"], endpoint_factory, out, err, request["cwd"])
+            response = {"status": status, "stdout": out.getvalue(), "stderr": err.getvalue()}
+            self.wfile.write(json.dumps(response).encode('utf-8') + b"\n")
+
+    # one thread per request, so a board that stops responding only holds up the requests for that board
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def server_close(self):
+            super().server_close()
+            endpoint_factory.close()
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = Server(socket_path, Handler)
+    os.chmod(socket_path, 0o600)
+    return server
+
+
+def serve(socket_path, timeout=DEFAULT_TIMEOUT):
+    import signal
+
+    server = make_server(socket_path, timeout=timeout)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def connect(socket_path):
+    import socket
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def _forward(sock, argv, out, err, cwd):
+    try:
+        sock.sendall(json.dumps({"argv": argv, "cwd": cwd}).encode('utf-8') + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    except OSError as e:
+        err.write(f"repl-client: lost connection to the daemon: {e}\n")
+        return 1
+    if not line:
+        err.write("repl-client: the daemon closed the connection without replying\n")
+        return 1
+    response = json.loads(line)
+    out.write(response["stdout"])
+    err.write(response["stderr"])
+    return response["status"]
+
+
+def forward(socket_path, argv, out, err, cwd):
+    with connect(socket_path) as sock:
+        return _forward(sock, argv, out, err, cwd)
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    socket_path = default_socket_path()
+    use_daemon = True
+    timeout = DEFAULT_TIMEOUT
+    while args and args[0].startswith("--"):
+        option = args.pop(0)
+        if option == "--socket" and args:
+            socket_path = args.pop(0)
+        elif option == "--no-daemon":
+            use_daemon = False
+        elif option == "--timeout" and args:
+            try:
+                timeout = float(args.pop(0)) or None
+            except ValueError:
+                sys.stderr.write(USAGE)
+                return 2
+        else:
+            sys.stderr.write(USAGE)
+            return 2
+    if args == ["daemon"]:
+        return serve(socket_path, timeout)
+    if len(args) > 2 and args[-2] == "exec" and args[-1] == "-":
+        args[-1] = sys.stdin.read()
+
+    sock = None
+    if use_daemon and os.path.exists(socket_path):
+        try:
+            sock = connect(socket_path)
+        except OSError:
+            # a stale socket left behind by a daemon that is no longer running
+            pass
+    if sock is not None:
+        with sock:
+            return _forward(sock, args, sys.stdout, sys.stderr, os.getcwd())
+    return run(args, EndpointFactory(timeout=timeout, operation_timeout=timeout), sys.stdout, sys.stderr, os.getcwd())
+
+
+if __name__ == "__main__":
+    sys.exit(main())
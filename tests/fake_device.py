@@ -0,0 +1,754 @@
+import base64
+import binascii
+import builtins
+import hashlib
+import io
+import json
+import os
+import pty
+import select
+import socket
+import struct
+import threading
+import time
+import traceback
+import tty
+import types
+import zlib
+from collections import deque
+
+EPOCH_OFFSET = 946684800
+
+
+class DeviceReset(Exception):
+    pass
+
+
+class Pipe:
+    def __init__(self, latency=0.0, capacity=None):
+        self.latency = latency
+        self.capacity = capacity
+        self.segments = deque()
+        self.size = 0
+        self.overrun = 0
+        self.cond = threading.Condition()
+        self.closed = False
+
+    def write(self, data):
+        with self.cond:
+            if self.capacity is not None:
+                room = max(0, self.capacity - self.size)
+                self.overrun += max(0, len(data) - room)
+                data = data[:room]
+            if data:
+                self.segments.append([time.monotonic() + self.latency, bytes(data)])
+                self.size += len(data)
+                self.cond.notify_all()
+
+    def read(self, n):
+        data = bytearray()
+        with self.cond:
+            while len(data) < n:
+                if self.segments and self.segments[0][0] <= time.monotonic():
+                    segment = self.segments[0]
+                    chunk = segment[1][:n - len(data)]
+                    segment[1] = segment[1][len(chunk):]
+                    if not segment[1]:
+                        self.segments.popleft()
+                    self.size -= len(chunk)
+                    data += chunk
+                elif self.closed:
+                    break
+                elif self.segments:
+                    self.cond.wait(self.segments[0][0] - time.monotonic())
+                else:
+                    self.cond.wait()
+        return bytes(data)
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+class StdinBuffer:
+    def __init__(self, device):
+        self.device = device
+
+    def read(self, n=1):
+        return self.device.read_input(n)
+
+    def readinto(self, buf):
+        data = self.device.read_input(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            line += self.device.read_input(1)
+        return bytes(line)
+
+
+class Stdin:
+    def __init__(self, device):
+        self.buffer = StdinBuffer(device)
+
+    def read(self, n=1):
+        return self.buffer.read(n).decode('utf-8')
+
+    def readline(self):
+        return self.buffer.readline().decode('utf-8')
+
+
+class StdoutBuffer:
+    def __init__(self, device):
+        self.device = device
+
+    def write(self, data):
+        self.device.output(bytes(data))
+        return len(data)
+
+
+class Stdout:
+    def __init__(self, device):
+        self.device = device
+        self.buffer = StdoutBuffer(device)
+
+    def write(self, text):
+        data = text.encode('utf-8') if isinstance(text, str) else bytes(text)
+        self.device.output(data.replace(b"\n", b"\r\n"))
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class FakeUos:
+    def __init__(self, device):
+        self.device = device
+
+    def _path(self, pathname):
+        return self.device.host_path(pathname)
+
+    def stat(self, pathname):
+        try:
+            st = os.stat(self._path(pathname))
+        except OSError as e:
+            raise OSError(e.errno)
+        mode = 0x4000 if os.path.isdir(self._path(pathname)) else 0x8000
+        mtime = int(st.st_mtime) - EPOCH_OFFSET
+        return (mode, 0, 0, 0, 0, 0, st.st_size if mode == 0x8000 else 0, mtime, mtime, mtime)
+
+    def listdir(self, pathname=''):
+        try:
+            return sorted(os.listdir(self._path(pathname)))
+        except OSError as e:
+            raise OSError(e.errno)
+
+    def ilistdir(self, pathname=''):
+        for name in self.listdir(pathname):
+            full = os.path.join(self._path(pathname), name)
+            if os.path.isdir(full):
+                yield (name, 0x4000, 0, 0)
+            else:
+                yield (name, 0x8000, 0, os.path.getsize(full))
+
+    def mkdir(self, pathname):
+        try:
+            os.mkdir(self._path(pathname))
+        except OSError as e:
+            raise OSError(e.errno)
+
+    def rmdir(self, pathname):
+        try:
+            os.rmdir(self._path(pathname))
+        except OSError as e:
+            raise OSError(e.errno)
+
+    def remove(self, pathname):
+        # FAT and littlefs both let uos.remove() unlink an empty directory
+        try:
+            if os.path.isdir(self._path(pathname)):
+                os.rmdir(self._path(pathname))
+            else:
+                os.remove(self._path(pathname))
+        except OSError as e:
+            raise OSError(e.errno)
+
+    def rename(self, old, new):
+        try:
+            os.replace(self._path(old), self._path(new))
+        except OSError as e:
+            raise OSError(e.errno)
+
+    def getcwd(self):
+        return '/'
+
+    def sync(self):
+        pass
+
+
+class FakeFile:
+    def __init__(self, f):
+        self.f = f
+
+    def __getattr__(self, name):
+        if name == 'truncate':
+            raise AttributeError("'FileIO' object has no attribute 'truncate'")
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.f.close()
+
+    def __iter__(self):
+        return iter(self.f)
+
+
+class FakeDeflateIO:
+    FORMATS = {1: -15, 2: 15, 3: 31}
+
+    def __init__(self, stream, fmt=0, wbits=0, close=False, compress=True):
+        self.stream = stream
+        self.decompressor = zlib.decompressobj(self.FORMATS.get(fmt, 47))
+        self.compressor = None
+        self.wbits = wbits if wbits and fmt == 2 else self.FORMATS.get(fmt, 15)
+        self.compress = compress
+        self.pending = b""
+        self.eof = False
+
+    def read(self, n=-1):
+        while (n < 0 or len(self.pending) < n) and not self.eof:
+            chunk = self.stream.read(256)
+            if not chunk:
+                self.pending += self.decompressor.flush()
+                self.eof = True
+            else:
+                self.pending += self.decompressor.decompress(chunk)
+        if n < 0:
+            n = len(self.pending)
+        data, self.pending = self.pending[:n], self.pending[n:]
+        return data
+
+    def readinto(self, buf):
+        data = self.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def write(self, data):
+        if not self.compress:
+            raise OSError(22)
+        if self.compressor is None:
+            self.compressor = zlib.compressobj(9, zlib.DEFLATED, self.wbits)
+        self.stream.write(self.compressor.compress(bytes(data)))
+        return len(data)
+
+    def close(self):
+        if self.compressor is not None:
+            self.stream.write(self.compressor.flush())
+            self.compressor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Device:
+    BANNER = b"MicroPython v1.22.0 on 2024-01-01; Fake board with fake chip\r\nType \"help()\" for more information.\r\n"
+    RAW_BANNER = b"raw REPL; CTRL-B to exit\r\n>"
+
+    def __init__(self, root, write, read, raw_paste=True, window_size=256, deflate=True, coalesce=False):
+        self.root = root
+        self.write = write
+        self.read = read
+        self.raw_paste = raw_paste
+        self.window_size = window_size
+        self.deflate = deflate
+        self.coalesce = coalesce
+        self.interrupt_char = 3
+        self.in_program = False
+        self.skip_prompt = False
+        self.globals = None
+        self.thread = None
+
+    def host_path(self, pathname):
+        if not pathname.startswith('/'):
+            pathname = '/' + pathname
+        return os.path.normpath(self.root + pathname)
+
+    def output(self, data):
+        self.write(data)
+
+    def getc(self):
+        c = self.read(1)
+        if c == b"":
+            raise DeviceReset()
+        return c
+
+    def read_input(self, n):
+        data = b""
+        while len(data) < n:
+            c = self.getc()
+            if c[0] == self.interrupt_char and self.in_program:
+                raise KeyboardInterrupt()
+            data += c
+        return data
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            self.soft_reset()
+            self.output(self.BANNER + b">>> ")
+            self.friendly_repl()
+        except DeviceReset:
+            pass
+
+    def soft_reset(self):
+        self.globals = self.fresh_globals()
+        self.interrupt_char = 3
+
+    def fresh_globals(self):
+        device = self
+        sys_module = types.ModuleType('sys')
+        sys_module.stdin = Stdin(self)
+        sys_module.stdout = Stdout(self)
+        sys_module.stderr = sys_module.stdout
+        sys_module.implementation = types.SimpleNamespace(name='micropython', version=(1, 22, 0))
+        sys_module.platform = 'fake'
+        sys_module.path = ['', '/lib']
+        sys_module.modules = {}
+        sys_module.print_exception = lambda e, f=None: traceback.print_exception(e)
+
+        uos = FakeUos(self)
+        uos_module = types.ModuleType('uos')
+        for name in ['stat', 'listdir', 'ilistdir', 'mkdir', 'rmdir', 'remove', 'rename', 'getcwd', 'sync']:
+            setattr(uos_module, name, getattr(uos, name))
+        uos_module.sep = '/'
+
+        binascii_module = types.ModuleType('ubinascii')
+        binascii_module.hexlify = binascii.hexlify
+        binascii_module.unhexlify = binascii.unhexlify
+        binascii_module.a2b_base64 = binascii.a2b_base64
+        binascii_module.b2a_base64 = lambda data, newline=True: binascii.b2a_base64(data, newline=newline)
+
+        hashlib_module = types.ModuleType('hashlib')
+        hashlib_module.sha256 = hashlib.sha256
+        hashlib_module.sha1 = hashlib.sha1
+
+        micropython_module = types.ModuleType('micropython')
+        micropython_module.kbd_intr = lambda c: setattr(device, 'interrupt_char', c)
+        micropython_module.const = lambda x: x
+
+        struct_module = types.ModuleType('ustruct')
+        for name in ['pack', 'unpack', 'calcsize', 'pack_into', 'unpack_from']:
+            setattr(struct_module, name, getattr(struct, name))
+
+        json_module = types.ModuleType('ujson')
+        json_module.dumps = lambda o: json.dumps(o, separators=(',', ':'))
+        json_module.loads = json.loads
+        json_module.load = json.load
+        json_module.dump = lambda o, f: f.write(json.dumps(o, separators=(',', ':')))
+
+        gc_module = types.ModuleType('gc')
+        gc_module.collect = lambda: None
+        gc_module.mem_free = lambda: 100000
+
+        time_module = types.ModuleType('utime')
+        time_module.sleep = time.sleep
+        time_module.sleep_ms = lambda ms: time.sleep(ms / 1000)
+        time_module.ticks_ms = lambda: int(time.monotonic() * 1000)
+        time_module.time = lambda: int(time.time()) - EPOCH_OFFSET
+
+        io_module = types.ModuleType('uio')
+        io_module.BytesIO = io.BytesIO
+        io_module.StringIO = io.StringIO
+
+        modules = {
+            'sys': sys_module, 'usys': sys_module,
+            'uos': uos_module, 'os': uos_module,
+            'ubinascii': binascii_module, 'binascii': binascii_module,
+            'hashlib': hashlib_module, 'uhashlib': hashlib_module,
+            'micropython': micropython_module,
+            'ustruct': struct_module, 'struct': struct_module,
+            'ujson': json_module, 'json': json_module,
+            'gc': gc_module,
+            'utime': time_module, 'time': time_module,
+            'uio': io_module, 'io': io_module,
+        }
+        if self.deflate:
+            # deflate='decompress' models a firmware built without MICROPY_PY_DEFLATE_COMPRESS
+            compress = self.deflate != 'decompress'
+            deflate_module = types.ModuleType('deflate')
+            deflate_module.DeflateIO = lambda *args, **kwargs: FakeDeflateIO(*args, compress=compress, **kwargs)
+            deflate_module.AUTO = 0
+            deflate_module.RAW = 1
+            deflate_module.ZLIB = 2
+            deflate_module.GZIP = 3
+            modules['deflate'] = deflate_module
+
+        def fake_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if name in modules:
+                return modules[name]
+            if name in sys_module.modules:
+                return sys_module.modules[name]
+            for directory in ('/', '/lib/'):
+                candidate = device.host_path(directory + name + '.py')
+                if os.path.isfile(candidate):
+                    module = types.ModuleType(name)
+                    module.__dict__['__builtins__'] = fake_builtins
+                    with open(candidate) as f:
+                        exec(compile(f.read(), name + '.py', 'exec'), module.__dict__)
+                    sys_module.modules[name] = module
+                    return module
+            raise ImportError("no module named '%s'" % name)
+
+        def fake_print(*args, sep=' ', end='\n', file=None):
+            (file or sys_module.stdout).write(sep.join(str(a) for a in args) + end)
+
+        def fake_open(pathname, mode='r', *args, **kwargs):
+            try:
+                return FakeFile(open(device.host_path(pathname), mode))
+            except OSError as e:
+                raise OSError(e.errno)
+
+        fake_builtins = dict(vars(builtins))
+        fake_builtins['__import__'] = fake_import
+        fake_builtins['print'] = fake_print
+        fake_builtins['open'] = fake_open
+        return {'__builtins__': fake_builtins, '__name__': '__main__'}
+
+    def friendly_repl(self):
+        line = b""
+        while True:
+            c = self.getc()
+            if c == b"\x01":
+                self.output(b"\r\n" + self.RAW_BANNER)
+                self.raw_repl()
+                self.output(self.BANNER + b">>> ")
+                line = b""
+            elif c == b"\x02":
+                self.output(b"\r\n" + self.BANNER + b">>> ")
+                line = b""
+            elif c == b"\x03":
+                self.output(b"\r\n>>> ")
+                line = b""
+            elif c == b"\x04":
+                self.output(b"\r\nMPY: soft reboot\r\n")
+                self.soft_reset()
+                self.output(self.BANNER + b">>> ")
+                line = b""
+            elif c == b"\r":
+                self.output(b"\r\n")
+                if line.strip():
+                    self.execute(line, friendly=True)
+                self.output(b">>> ")
+                line = b""
+            elif c != b"\n":
+                line += c
+                self.output(c)
+
+    def raw_repl(self):
+        line = b""
+        while True:
+            c = self.getc()
+            if c == b"\x01":
+                self.output(self.RAW_BANNER)
+                line = b""
+            elif c == b"\x02":
+                self.output(b"\r\n")
+                return
+            elif c == b"\x03":
+                line = b""
+            elif c == b"\x05" and line == b"" and self.raw_paste != 'legacy':
+                request = self.getc() + self.getc()
+                if request != b"A\x01":
+                    line += c + request
+                elif self.raw_paste:
+                    self.output(b"R\x01" + struct.pack("<H", self.window_size))
+                    try:
+                        code = self.raw_paste_receive()
+                    except KeyboardInterrupt:
+                        # the reader acknowledges the end of data, then reports the interrupt without a traceback
+                        self.output(b"\x04\x04KeyboardInterrupt: \r\n\x04")
+                        self.prompt()
+                        continue
+                    self.output(b"\x04")
+                    self.execute(code)
+                    self.prompt()
+                else:
+                    self.output(b"R\x00")
+            elif c == b"\x04":
+                if line == b"":
+                    self.output(b"OK\r\nMPY: soft reboot\r\n")
+                    self.soft_reset()
+                    self.output(self.RAW_BANNER)
+                else:
+                    self.output(b"OK")
+                    self.execute(line)
+                    self.prompt()
+                    line = b""
+            else:
+                line += c
+
+    def raw_paste_receive(self):
+        code = bytearray()
+        consumed = 0
+        while True:
+            c = self.getc()
+            if c == b"\x04":
+                return bytes(code)
+            if c == b"\x03":
+                raise KeyboardInterrupt()
+            code += c
+            consumed += 1
+            if consumed == self.window_size:
+                consumed = 0
+                self.output(b"\x01")
+
+    def prompt(self):
+        if self.skip_prompt:
+            self.skip_prompt = False
+        else:
+            self.output(b">")
+
+    def execute(self, code, friendly=False):
+        self.in_program = True
+        error = b""
+        try:
+            exec(compile(code.decode('utf-8'), '<stdin>', 'single' if friendly else 'exec'), self.globals)
+        except DeviceReset:
+            raise
+        except BaseException as e:
+            error = ("Traceback (most recent call last):\r\n  File \"<stdin>\", line 1, in <module>\r\n%s: %s\r\n" % (
+                type(e).__name__, e)).encode('utf-8')
+        finally:
+            self.in_program = False
+            self.interrupt_char = 3
+        if friendly:
+            self.output(error)
+        elif self.coalesce:
+            # some WebREPL builds send the whole response tail as a single frame
+            self.output(b"\x04" + error + b"\x04>")
+            self.skip_prompt = True
+        else:
+            self.output(b"\x04")
+            if error:
+                self.output(error)
+            self.output(b"\x04")
+
+
+class PtyDevice:
+    def __init__(self, root, baud=None, latency=0.0, rx_buffer_size=None, **kwargs):
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+        self.baud = baud
+        self.closed = False
+        self.rx = Pipe(latency, rx_buffer_size)
+        self.device = Device(root, self.transmit, self.rx.read, **kwargs)
+        self.pump_thread = threading.Thread(target=self.pump, daemon=True)
+        self.pump_thread.start()
+        self.device.start()
+
+    def pace(self, data):
+        if self.baud:
+            time.sleep(len(data) * 10 / self.baud)
+
+    def pump(self):
+        while not self.closed:
+            readable, _, _ = select.select([self.master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except (BlockingIOError, InterruptedError):
+                continue
+            except OSError:
+                break
+            self.pace(data)
+            self.rx.write(data)
+        self.rx.close()
+
+    def transmit(self, data):
+        self.pace(data)
+        view = memoryview(data)
+        while view:
+            if self.closed:
+                raise DeviceReset()
+            try:
+                view = view[os.write(self.master, view):]
+            except BlockingIOError:
+                select.select([], [self.master], [], 0.05)
+            except OSError:
+                raise DeviceReset()
+
+    def close(self):
+        self.closed = True
+        self.rx.close()
+        self.pump_thread.join()
+        self.device.thread.join(1)
+        os.close(self.slave)
+        os.close(self.master)
+
+
+class WebReplServer:
+    BLOCK_SIZE = 256
+
+    def __init__(self, root, password='password', latency=0.0, **kwargs):
+        self.root = root
+        self.password = password
+        self.latency = latency
+        self.kwargs = kwargs
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.url = f"ws://127.0.0.1:{self.sock.getsockname()[1]}/"
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=WebReplSession(self, conn).run, daemon=True).start()
+
+    def close(self):
+        self.sock.close()
+
+
+class WebReplSession:
+    def __init__(self, server, conn):
+        self.server = server
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.stdin = Pipe(server.latency)
+        self.device = Device(server.root, self.send_frame, self.stdin.read, **server.kwargs)
+
+    def recv_exactly(self, n):
+        data = b""
+        while len(data) < n:
+            chunk = self.conn.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError()
+            data += chunk
+        return data
+
+    def read_frame(self):
+        header = self.recv_exactly(2)
+        opcode = header[0] & 0x0f
+        length = header[1] & 0x7f
+        if length == 126:
+            (length,) = struct.unpack("!H", self.recv_exactly(2))
+        elif length == 127:
+            (length,) = struct.unpack("!Q", self.recv_exactly(8))
+        mask = self.recv_exactly(4) if header[1] & 0x80 else b"\0\0\0\0"
+        payload = bytearray(self.recv_exactly(length))
+        for i in range(len(payload)):
+            payload[i] ^= mask[i % 4]
+        return opcode, bytes(payload)
+
+    def send_frame(self, data, opcode=1):
+        header = bytes([0x80 | opcode])
+        if len(data) < 126:
+            header += bytes([len(data)])
+        elif len(data) < 65536:
+            header += bytes([126]) + struct.pack("!H", len(data))
+        else:
+            header += bytes([127]) + struct.pack("!Q", len(data))
+        try:
+            with self.send_lock:
+                self.conn.sendall(header + data)
+        except OSError:
+            raise DeviceReset()
+
+    def handshake(self):
+        request = b""
+        while b"\r\n\r\n" not in request:
+            chunk = self.conn.recv(1024)
+            if not chunk:
+                raise ConnectionError()
+            request += chunk
+        key = [line.split(b":", 1)[1].strip() for line in request.split(b"\r\n")
+               if line.lower().startswith(b"sec-websocket-key")][0]
+        accept = base64.b64encode(hashlib.sha1(key + b"258EAFA5-E914-47DA-95CA-C5AB0DC85B11").digest())
+        self.conn.sendall(b"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                          b"Sec-WebSocket-Accept: " + accept + b"\r\n\r\n")
+
+    def login(self):
+        self.send_frame(b"Password: ")
+        password = b""
+        while not password.endswith(b"\r\n"):
+            opcode, payload = self.read_frame()
+            password += payload
+        if password[:-2].decode() != self.server.password:
+            self.send_frame(b"\r\nAccess denied\r\n")
+            return False
+        self.send_frame(b"\r\nWebREPL connected\r\n")
+        return True
+
+    def run(self):
+        try:
+            self.handshake()
+            if self.login():
+                self.device.start()
+                while True:
+                    opcode, payload = self.read_frame()
+                    if opcode == 8:
+                        break
+                    if opcode == 2:
+                        self.file_transfer(payload)
+                    else:
+                        self.stdin.write(payload)
+        except (ConnectionError, OSError, DeviceReset):
+            pass
+        self.stdin.close()
+        self.conn.close()
+
+    def file_transfer(self, header):
+        sig, op, flags, offset, size, fname_len, fname = struct.unpack("<2sBBQLH64s", header)
+        pathname = self.device.host_path(fname[:fname_len].decode())
+        if op == 1:
+            self.send_frame(b"WB\0\0", 2)
+            received = bytearray()
+            while len(received) < size:
+                opcode, payload = self.read_frame()
+                received += payload
+            with open(pathname, "wb") as f:
+                f.write(received)
+            time.sleep(self.server.latency)
+            self.send_frame(b"WB\0\0", 2)
+        elif op == 2:
+            try:
+                f = open(pathname, "rb")
+            except OSError:
+                self.send_frame(b"WB\1\0", 2)
+                return
+            self.send_frame(b"WB\0\0", 2)
+            pending = deque()
+            done = False
+            with f:
+                while not done or pending:
+                    timeout = max(0.0, pending[0][0] - time.monotonic()) if pending else None
+                    if not done and select.select([self.conn], [], [], timeout)[0]:
+                        self.read_frame()
+                        data = f.read(WebReplServer.BLOCK_SIZE)
+                        pending.append((time.monotonic() + self.server.latency, struct.pack("<H", len(data)) + data))
+                        done = not data
+                    else:
+                        due, frame = pending.popleft()
+                        time.sleep(max(0.0, due - time.monotonic()))
+                        self.send_frame(frame, 2)
+            self.send_frame(b"WB\0\0", 2)
@@ -2,6 +2,7 @@ import random
 import string
 
 import pytest
+import io
 import os
 import hashlib
 
@@ -19,6 +20,34 @@ def test_put_file_get_file_remove(client, content):
     client.remove('/test.txt')
 
 
+def test_put_file_get_file_binary(client):
+    content = bytes(range(256)) * 16
+    client.put_file('/test.bin', content)
+    assert content == client.get_file('/test.bin')
+    client.remove('/test.bin')
+
+
+def test_put_stream_get_stream(client):
+    content = os.urandom(5000)
+    client.put_stream('/test.bin', io.BytesIO(content))
+    sink = io.BytesIO()
+    assert len(content) == client.get_stream('/test.bin', sink)
+    assert content == sink.getvalue()
+    client.put_stream('/test.bin', iter([content[:100], content[100:]]))
+    assert content == client.get_file('/test.bin')
+    client.remove('/test.bin')
+
+
+def test_get_with_chunk_size(client):
+    content = os.urandom(5000)
+    client.put_file('/test.bin', content)
+    sink = io.BytesIO()
+    assert len(content) == client.get_stream('/test.bin', sink, 512)
+    assert content == sink.getvalue()
+    assert content == client.get_file('/test.bin', 512)
+    client.remove('/test.bin')
+
+
 def test_sha256(client):
     content = bytearray(os.urandom(256))
     sha256_hash = hashlib.sha256(content).digest()
@@ -27,6 +56,29 @@ def test_sha256(client):
     client.remove('/test.txt')
 
 
+def test_sha256_many(client):
+    contents = [os.urandom(size) for size in (0, 100, 3000)]
+    for i, content in enumerate(contents):
+        client.put_file(f'/test{i}.txt', content)
+    expected = [hashlib.sha256(content).digest() for content in contents]
+    assert expected == client.sha256_many([f'/test{i}.txt' for i in range(len(contents))])
+    for i in range(len(contents)):
+        client.remove(f'/test{i}.txt')
+
+
+def test_sha256_with_manifest(client):
+    client.manifest_pathname = '/.repl_client_manifest'
+    client.put_file('/test.txt', b'Hello World!')
+    assert hashlib.sha256(b'Hello World!').digest() == client.sha256('/test.txt')
+    assert client.exists('/.repl_client_manifest')
+    assert '/.repl_client_manifest' not in client.walk()
+    client.put_file('/test.txt', b'Hello World?')
+    assert hashlib.sha256(b'Hello World?').digest() == client.sha256('/test.txt')
+    client.remove('/test.txt')
+    client.manifest_pathname = None
+    client.remove('/.repl_client_manifest')
+
+
 def test_isfile(client):
     assert client.isfile("/boot.py")
     assert not client.isfile("/")
@@ -46,6 +98,33 @@ def test_exists(client):
     assert not client.exists('/dne')
 
 
+def test_stat_many(client):
+    client.put_file('/test.txt', b'Hello World!')
+    client.mkdir('/test')
+    file_stat, dir_stat, dne_stat = client.stat_many(['/test.txt', '/test', '/dne'])
+    assert not file_stat.isdir
+    assert file_stat.size == 12
+    assert dir_stat.isdir
+    assert dne_stat is None
+    client.remove('/test')
+    client.remove('/test.txt')
+
+
+def test_walk(client):
+    client.mkdir('/test')
+    client.mkdir('/test/sub')
+    client.put_file('/test/sub/test.txt', b'Hello World!')
+    tree = client.walk('/test')
+    assert sorted(tree) == ['/test/sub', '/test/sub/test.txt']
+    assert tree['/test/sub'].isdir
+    assert tree['/test/sub/test.txt'].size == 12
+    assert '/boot.py' in client.walk()
+    assert '/test/sub/test.txt' in client.walk('/')
+    client.remove('/test/sub/test.txt')
+    client.remove('/test/sub')
+    client.remove('/test')
+
+
 def test_listdir(client):
     assert 'boot.py' in client.listdir()
 
@@ -78,6 +157,19 @@ def test_mkdir(client):
     client.remove('/test')
 
 
+def test_pathnames_with_quotes(client):
+    client.mkdir("/it's")
+    assert client.isdir("/it's")
+    assert client.exists("/it's")
+    assert client.listdir("/it's") == []
+    client.put_file("/it's/a 'b'.txt", b'Hello World!')
+    assert client.isfile("/it's/a 'b'.txt")
+    assert "a 'b'.txt" in client.listdir("/it's")
+    client.remove("/it's/a 'b'.txt")
+    client.remove("/it's")
+    assert not client.exists("/it's")
+
+
 def test_remove_file(client):
     client.put_file('/test.txt', b'')
     client.remove('/test.txt')
@@ -0,0 +1,24 @@
+import shutil
+import tempfile
+from unittest.mock import Mock
+
+import pytest
+import websocket
+
+from .context import repl_client
+
+
+@pytest.fixture
+def root():
+    retval = tempfile.mkdtemp()
+    with open(retval + "/boot.py", "wb+") as f:
+        pass
+    yield retval
+    shutil.rmtree(retval)
+
+
+def web_client(*frames):
+    connection = Mock()
+    connection.gettimeout.return_value = None
+    connection.recv.side_effect = list(frames) + [websocket.WebSocketTimeoutException()] * 2
+    return repl_client.WebReplClient(connection, password='password')
@@ -0,0 +1,191 @@
+import hashlib
+import time
+
+import pytest
+
+
+def test_recv_with_timeout(client):
+    t0 = time.time()
+    retval = client.with_timeout(1.0, lambda: client.recv())
+    t = time.time() - t0
+    assert retval == b''
+    assert t > 0.99
+
+
+def test_recv_until_with_timeout(client):
+    t0 = time.time()
+    retval = client.with_timeout(1.0, lambda: client.recv_until(b'>>> '))
+    t = time.time() - t0
+    assert retval == b''
+    assert t > 0.99
+
+
+def test_recv_exactly_with_timeout(client):
+    t0 = time.time()
+    with pytest.raises(TimeoutError):
+        client.with_timeout(1.0, lambda: client.recv_exactly(4))
+    assert time.time() - t0 > 0.99
+
+
+def test_both_modes(client):
+    assert not client.in_raw_repl_mode
+    client.enter_raw_repl_mode()
+    assert client.in_raw_repl_mode
+    client.enter_repl_mode()
+    assert not client.in_raw_repl_mode
+
+
+def test_exec(client):
+    result, error = client.exec("print(repr(1+2), end='')")
+
+    assert result == b"3"
+    assert error == b""
+
+
+def test_exception(client):
+    result, error = client.exec("raise(Exception())")
+
+    assert result == b""
+    assert error != b""
+
+
+def test_eval(client):
+    assert client.eval("1+2") == 3
+
+
+def test_import_is_cached(client):
+    client._import("uos")
+    assert "uos" in client.session
+    client.exec("del uos")
+    client._import("uos")
+    with pytest.raises(Exception):
+        client.eval("uos.listdir('/')")
+    assert "uos" not in client.session
+    client._import("uos")
+    assert client.eval("uos.listdir('/')") is not None
+
+
+def test_soft_reset_clears_session(client):
+    client._import("uos")
+    client.soft_reset()
+    assert client.session == set()
+    assert client.eval("1+2") == 3
+
+
+def test_exec_large_command(client):
+    client.exec("x = 0\n" + "x += 1\n" * 2000)
+    assert client.eval("x") == 2000
+
+
+def test_exec_without_raw_paste_mode(client):
+    client.use_raw_paste_mode = False
+    result, error = client.exec("print(repr(1+2), end='')")
+
+    assert result == b"3"
+    assert error == b""
+
+
+def test_exec_many(client):
+    commands = ["x = 1", "print(x, end='')", "raise Exception()", "x += 1\n" * 100, "print(x, end='')"]
+    responses = client.exec_many(commands)
+
+    assert len(responses) == len(commands)
+    assert responses[1] == (b"1", b"")
+    assert responses[2][1] != b""
+    assert responses[4] == (b"101", b"")
+    assert [error == b"" for result, error in responses] == [True, True, False, True, True]
+
+
+def test_put_file_get_file_with_and_without_compression(client):
+    content = b"print('Hello World!')\n" * 500 + bytes(range(256))
+    for use_compression in (True, False):
+        client.use_compression = use_compression
+        client.put_file('/test.py', content)
+        assert content == client.get_file('/test.py')
+    client.remove('/test.py')
+
+
+def test_agent(client):
+    content = b"Hello 'World'!"
+    client.put_file("/it's.txt", content)
+    client.use_agent = True
+
+    assert client.isfile("/it's.txt")
+    assert client.exists("/it's.txt")
+    assert not client.exists("/dne")
+    assert "it's.txt" in client.listdir("/")
+    assert client.stat_many(["/it's.txt", "/dne"])[0].size == len(content)
+    assert client.stat_many(["/it's.txt", "/dne"])[1] is None
+    assert client.sha256("/it's.txt") == hashlib.sha256(content).digest()
+    client.mkdir("/it's")
+    assert client.isdir("/it's")
+    with pytest.raises(Exception):
+        client.isdir("/dne")
+    assert client.eval("1+2") == 3
+    client.remove("/it's")
+    client.remove("/it's.txt")
+    assert not client.exists("/it's.txt")
+    assert "/repl_client_agent.py" not in client.walk()
+    client.remove("/repl_client_agent.py")
+
+
+def test_put_file_delta(client):
+    original = bytes(range(256)) * 20
+    assert client.put_file_delta('/test.bin', original) is None
+    assert original == client.get_file('/test.bin')
+
+    for use_compression in (True, False):
+        client.use_compression = use_compression
+        client.put_file('/test.bin', original)
+        assert client.put_file_delta('/test.bin', original) == []
+
+        content = original[:1500] + b"changed" + original[1507:] + b"appended"
+        assert client.put_file_delta('/test.bin', content, block_size=512) == [2, 10]
+        assert content == client.get_file('/test.bin')
+
+        content = content[:3000] + b"changed"
+        assert client.put_file_delta('/test.bin', content, block_size=512) == [5]
+        assert content == client.get_file('/test.bin')
+    client.remove('/test.bin')
+
+
+def test_with_timeout_restores_timeout_on_exception(client):
+    previous = client.get_timeout()
+    with pytest.raises(ZeroDivisionError):
+        client.with_timeout(1.0, lambda: 1 / 0)
+    assert client.get_timeout() == previous
+
+
+def test_operation_timeout_resyncs_stalled_repl(client):
+    previous = client.get_timeout()
+    client.operation_timeout = 0.5
+    content = bytes(range(256)) * 16
+    client.put_file('/test.bin', content)
+    assert content == client.get_file('/test.bin')
+
+    t0 = time.time()
+    with pytest.raises(TimeoutError):
+        client.exec("import sys\nsys.stdin.read(1)")
+    assert time.time() - t0 < 3
+    assert client.get_timeout() == previous
+    assert client.eval("1+2") == 3
+    client.operation_timeout = None
+    client.remove('/test.bin')
+
+
+def test_put_tree_get_tree(client):
+    files = {f'/pkg/sub{i % 3}/module{i}.py': f"x = {i}\n".encode('utf-8') * i for i in range(20)}
+    files['/pkg/data.bin'] = bytes(range(256)) * 10
+    files['/pkg/empty.py'] = b""
+    for use_compression in (True, False):
+        client.use_compression = use_compression
+        client.put_tree(files)
+        assert client.isdir('/pkg/sub1')
+        assert files['/pkg/sub2/module5.py'] == client.get_file('/pkg/sub2/module5.py')
+        assert files == client.get_tree(sorted(files))
+    with pytest.raises(Exception):
+        client.get_tree(['/pkg/data.bin', '/pkg/dne.py'])
+    assert client.eval("1+2") == 3
+    for pathname in sorted(client.walk('/pkg'), reverse=True):
+        client.remove(pathname)
+    client.remove('/pkg')
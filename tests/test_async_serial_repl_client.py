@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import os
+
+from .context import repl_client
+from .config import SERIAL_CONFIG
+
+from repl_client import aio
+
+
+def run_with_client(callback):
+    async def main():
+        client = await aio.connect_serial(SERIAL_CONFIG['port'], SERIAL_CONFIG['baud'])
+        try:
+            return await callback(client)
+        finally:
+            await client.close()
+    return asyncio.run(main())
+
+
+def test_exec():
+    async def callback(client):
+        return await client.exec("print(repr(1+2), end='')")
+
+    assert run_with_client(callback) == (b"3", b"")
+
+
+def test_eval():
+    async def callback(client):
+        return await client.eval("1+2")
+
+    assert run_with_client(callback) == 3
+
+
+def test_exception():
+    async def callback(client):
+        return await client.exec("raise(Exception())")
+
+    result, error = run_with_client(callback)
+    assert result == b""
+    assert error != b""
+
+
+def test_recv_with_timeout():
+    async def callback(client):
+        return await client.with_timeout(1.0, lambda: client.recv())
+
+    assert run_with_client(callback) == b''
+
+
+def test_put_file_get_file_remove():
+    content = os.urandom(4096)
+
+    async def callback(client):
+        await client.put_file('/test.bin', content)
+        retval = await client.get_file('/test.bin'), await client.sha256('/test.bin')
+        await client.remove('/test.bin')
+        return retval
+
+    assert run_with_client(callback) == (content, hashlib.sha256(content).digest())
+
+
+def test_filesystem():
+    async def callback(client):
+        await client.mkdir('/test')
+        retval = await client.isdir('/test'), await client.exists('/test'), await client.listdir('/')
+        await client.remove('/test')
+        return retval
+
+    isdir, exists, listing = run_with_client(callback)
+    assert isdir
+    assert exists
+    assert 'test' in listing
+
+
+def test_walk():
+    async def callback(client):
+        return await client.walk()
+
+    assert '/boot.py' in run_with_client(callback)
@@ -0,0 +1,171 @@
+import json
+import os
+import time
+
+import pytest
+import serial
+import websocket
+
+from .context import repl_client
+from .fake_device import PtyDevice, WebReplServer
+from .fixtures import root
+
+BENCHMARK_OUTPUT = os.environ.get("REPL_CLIENT_BENCHMARK_OUTPUT")
+BENCHMARK_BASELINE = os.environ.get("REPL_CLIENT_BENCHMARK_BASELINE")
+# a benchmark fails when it is this many times (plus a little slack) slower than the same benchmark in the baseline
+BASELINE_TOLERANCE = 2.0
+BASELINE_SLACK = 0.01
+
+pytestmark = pytest.mark.skipif(
+    not (os.environ.get("REPL_CLIENT_BENCHMARK") or BENCHMARK_OUTPUT or BENCHMARK_BASELINE),
+    reason="set REPL_CLIENT_BENCHMARK=1 to run the benchmarks")
+
+PROFILES = {
+    'serial': dict(baud=921600, latency=0.002),
+    'websocket': dict(latency=0.005),
+}
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    retval = {}
+    if BENCHMARK_BASELINE:
+        with open(BENCHMARK_BASELINE) as f:
+            for line in f:
+                result = json.loads(line)
+                retval[(result["benchmark"], result["profile"])] = result
+    return retval
+
+
+@pytest.fixture(params=sorted(PROFILES))
+def client(request, root):
+    if request.param == 'serial':
+        device = PtyDevice(root, **PROFILES['serial'])
+        retval = repl_client.SerialReplClient(serial.Serial(device.port, 921600, timeout=10))
+    else:
+        device = WebReplServer(root, **PROFILES['websocket'])
+        connection = websocket.WebSocket()
+        connection.connect(device.url)
+        connection.settimeout(10)
+        retval = repl_client.WebReplClient(connection, password='password')
+    retval.profile = request.param
+    yield retval
+    retval.close()
+    device.close()
+
+
+def measure(client, record_property, name, callback, repeat=1, size=None, max_latency=None, max_round_trips=None,
+            baseline=None):
+    instrumentation = client.enable_instrumentation()
+    instrumentation.reset()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        retval = callback()
+    elapsed = time.perf_counter() - start
+    stats = instrumentation.snapshot()
+    client.disable_instrumentation()
+
+    result = {
+        "benchmark": name,
+        "profile": client.profile,
+        "latency": elapsed / repeat,
+        "round_trips": stats["round_trips"] / repeat,
+        "bytes_sent": stats["bytes_sent"] / repeat,
+        "bytes_received": stats["bytes_received"] / repeat,
+        "sleep_time": stats["sleep_time"] / repeat,
+    }
+    if size is not None:
+        result["throughput"] = size * repeat / elapsed
+    record_property(name, result)
+    if BENCHMARK_OUTPUT:
+        with open(BENCHMARK_OUTPUT, "a") as f:
+            f.write(json.dumps(result) + "\n")
+
+    if max_latency is not None:
+        assert result["latency"] < max_latency, result
+    if max_round_trips is not None:
+        assert result["round_trips"] <= max_round_trips, result
+    previous = (baseline or {}).get((name, client.profile))
+    if previous is not None:
+        assert result["latency"] < BASELINE_TOLERANCE * previous["latency"] + BASELINE_SLACK, (result, previous)
+    return retval
+
+
+def test_exec(client, record_property, baseline):
+    result, error = measure(client, record_property, "exec", lambda: client.exec("x = 1"), repeat=20,
+                            max_latency=0.1, max_round_trips=3, baseline=baseline)
+    assert error == b""
+
+
+def test_eval(client, record_property, baseline):
+    assert measure(client, record_property, "eval", lambda: client.eval("1+2"), repeat=20,
+                   max_latency=0.1, max_round_trips=3, baseline=baseline) == 3
+
+
+@pytest.mark.parametrize("size", [1024, 65536])
+def test_put_file(client, record_property, baseline, size):
+    content = os.urandom(size)
+    measure(client, record_property, f"put_file_{size}", lambda: client.put_file('/test.bin', content), size=size,
+            max_latency=0.2 + size / 10000, baseline=baseline)
+    assert content == client.get_file('/test.bin')
+
+
+@pytest.mark.parametrize("size", [1024, 65536])
+def test_get_file(client, record_property, baseline, size):
+    content = os.urandom(size)
+    client.put_file('/test.bin', content)
+    assert content == measure(client, record_property, f"get_file_{size}", lambda: client.get_file('/test.bin'),
+                              size=size, max_latency=0.2 + size / 10000, baseline=baseline)
+
+
+def test_sha256(client, record_property, baseline):
+    content = os.urandom(65536)
+    client.put_file('/test.bin', content)
+    measure(client, record_property, "sha256", lambda: client.sha256('/test.bin'), size=len(content),
+            max_latency=0.2, max_round_trips=5, baseline=baseline)
+
+
+def test_listing(client, record_property, baseline):
+    client.mkdir('/lib')
+    for i in range(20):
+        client.put_file(f'/lib/module{i}.py', b'x = 1')
+
+    assert len(measure(client, record_property, "listdir", lambda: client.listdir('/lib'), repeat=5,
+                       max_latency=0.1, max_round_trips=4, baseline=baseline)) == 20
+    assert len(measure(client, record_property, "walk", lambda: client.walk(), repeat=5,
+                       max_latency=0.1, max_round_trips=4, baseline=baseline)) == 22
+
+
+@pytest.mark.parametrize("use_agent", [False, True], ids=["script", "agent"])
+def test_stat_many(client, record_property, baseline, use_agent):
+    pathnames = [f'/test{i}.txt' for i in range(50)]
+    for pathname in pathnames:
+        client.put_file(pathname, b'x = 1')
+    client.use_agent = use_agent
+    client.stat_many(pathnames)
+
+    stats = measure(client, record_property, f"stat_many_{'agent' if use_agent else 'script'}",
+                    lambda: client.stat_many(pathnames), repeat=5, max_latency=0.2, max_round_trips=10,
+                    baseline=baseline)
+    assert all(stat.size == 5 for stat in stats)
+
+
+@pytest.mark.parametrize("bundle", [False, True], ids=["put_file", "put_tree"])
+def test_upload_tree(client, record_property, baseline, bundle):
+    files = {f'/lib/pkg{i % 4}/module{i}.py': f"x = {i}\n".encode('utf-8') * 20 for i in range(40)}
+
+    def upload():
+        if bundle:
+            client.put_tree(files)
+        else:
+            for pathname, content in files.items():
+                client.put_file(pathname, content)
+
+    if not bundle:
+        client.mkdir('/lib')
+        for i in range(4):
+            client.mkdir(f'/lib/pkg{i}')
+    measure(client, record_property, f"upload_tree_{'put_tree' if bundle else 'put_file'}", upload,
+            size=sum(len(content) for content in files.values()), max_latency=0.5 if bundle else 5.0,
+            max_round_trips=30 if bundle else None, baseline=baseline)
+    assert client.get_tree(sorted(files)) == files
@@ -0,0 +1,166 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+
+from .context import repl_client
+from .fake_device import PtyDevice
+from .fixtures import root
+
+import repl_client.cli
+
+
+@pytest.fixture
+def device(root):
+    retval = PtyDevice(root)
+    yield retval
+    retval.close()
+
+
+@pytest.fixture
+def cwd():
+    retval = tempfile.mkdtemp()
+    yield retval
+    shutil.rmtree(retval)
+
+
+def run(argv, cwd, endpoint_factory=None):
+    out = io.StringIO()
+    err = io.StringIO()
+    status = repl_client.cli.run(argv, endpoint_factory or repl_client.EndpointFactory(), out, err, cwd)
+    return status, out.getvalue(), err.getvalue()
+
+
+def test_cli_does_not_import_transports():
+    import subprocess
+    import sys
+    code = "import sys, repl_client.cli; print('serial' in sys.modules, 'websocket' in sys.modules)"
+    env = dict(os.environ, PYTHONPATH=os.path.join(os.path.dirname(__file__), '..', 'src'))
+    assert subprocess.check_output([sys.executable, "-c", code], env=env) == b"False False\n"
+
+
+def test_cli_commands(device, root, cwd):
+    with open(cwd + "/main.py", "wb") as f:
+        f.write(b"print('Hello World!')")
+
+    assert run([device.port, "cp", "main.py", ":/"], cwd)[0] == 0
+    assert run([device.port, "ls"], cwd) == (0, "boot.py\nmain.py\n", "")
+    assert run([device.port, "sha256", "/main.py"], cwd) == (
+        0, hashlib.sha256(b"print('Hello World!')").hexdigest() + "  /main.py\n", "")
+    assert run([device.port, "exec", "exec(open('main.py').read())"], cwd) == (0, "Hello World!\n", "")
+    assert run([device.port, "cp", ":/main.py", "copy.py"], cwd)[0] == 0
+    with open(cwd + "/copy.py", "rb") as f:
+        assert f.read() == b"print('Hello World!')"
+    assert run([device.port, "rm", "/main.py"], cwd)[0] == 0
+    assert not os.path.exists(root + "/main.py")
+
+
+def test_cli_sync(cwd, root):
+    os.mkdir(cwd + "/src")
+    os.mkdir(cwd + "/src/lib")
+    with open(cwd + "/src/lib/module.py", "wb") as f:
+        f.write(b"x = 1")
+
+    assert run([root, "sync", "src"], cwd) == (0, "created /lib\ncopied /lib/module.py\n", "")
+    assert run([root, "sync", "src", "--delete"], cwd) == (0, "removed /boot.py\n", "")
+
+
+def test_cli_reports_errors(device, cwd):
+    status, out, err = run([device.port, "exec", "1/0"], cwd)
+    assert status == 1
+    assert "ZeroDivisionError" in err
+    assert run([device.port, "frobnicate"], cwd)[0] == 2
+    assert run([device.port, "cp", "a", "b"], cwd)[0] == 2
+    assert run([cwd + "/dne", "ls"], cwd)[0] == 1
+
+
+def test_daemon_keeps_connections_open(device, cwd):
+    socket_path = cwd + "/daemon.sock"
+    server = repl_client.cli.make_server(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        out = io.StringIO()
+        err = io.StringIO()
+        assert repl_client.cli.forward(socket_path, [device.port, "exec", "x = 42"], out, err, cwd) == 0
+        assert repl_client.cli.forward(socket_path, [device.port, "exec", "print(x)"], out, err, cwd) == 0
+        assert out.getvalue() == "42\n"
+        assert err.getvalue() == ""
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not os.path.exists(socket_path)
+
+
+def test_daemon_serves_boards_concurrently(root, device, cwd):
+    other = PtyDevice(root)
+    socket_path = cwd + "/daemon.sock"
+    server = repl_client.cli.make_server(socket_path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        slow = threading.Thread(target=repl_client.cli.forward,
+                                args=(socket_path, [device.port, "exec", "import time\ntime.sleep(2)"],
+                                      io.StringIO(), io.StringIO(), cwd))
+        slow.start()
+        time.sleep(0.2)
+        out = io.StringIO()
+        t0 = time.monotonic()
+        assert repl_client.cli.forward(socket_path, [other.port, "exec", "print(42)"], out, io.StringIO(), cwd) == 0
+        assert time.monotonic() - t0 < 1.5
+        assert out.getvalue() == "42\n"
+        slow.join()
+    finally:
+        server.shutdown()
+        server.server_close()
+        other.close()
+
+
+def test_cli_operation_timeout(device, cwd):
+    endpoint_factory = repl_client.EndpointFactory(operation_timeout=0.5)
+    t0 = time.monotonic()
+    status, out, err = run([device.port, "exec", "import time\ntime.sleep(3)"], cwd, endpoint_factory)
+    assert status == 1
+    assert time.monotonic() - t0 < 3
+
+
+def test_cli_attaches_without_resetting(device, cwd):
+    assert run([device.port, "exec", "x = 42"], cwd)[0] == 0
+    assert run([device.port, "-a", "exec", "print(x)"], cwd) == (0, "42\n", "")
+    assert run([device.port, "exec", "print(x)"], cwd)[0] == 1
+
+
+def test_main_falls_back_only_when_no_daemon_listens(cwd, capsys):
+    import socket
+    socket_path = cwd + "/daemon.sock"
+    with open(cwd + "/local.py", "wb"):
+        pass
+
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    assert repl_client.cli.main(["--socket", socket_path, cwd, "ls"]) == 0
+    assert "local.py" in capsys.readouterr().out
+    os.remove(socket_path)
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        server.bind(socket_path)
+        server.listen(1)
+
+        def hang_up():
+            conn, _ = server.accept()
+            conn.recv(4096)
+            conn.close()
+
+        thread = threading.Thread(target=hang_up)
+        thread.start()
+        assert repl_client.cli.main(["--socket", socket_path, cwd, "ls"]) == 1
+        thread.join()
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert "without replying" in captured.err
@@ -1,5 +1,5 @@
 import tempfile
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
 
@@ -37,7 +37,7 @@ def test_build_endpoint_serial_with_default_baud():
     args = []
     endpoint_factory.build_endpoint("/dev/ttyUSB0", args)
 
-    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 115200)
+    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 115200, False)
     assert args == []
 
 
@@ -49,7 +49,7 @@ def test_build_endpoint_serial_with_specified_baud_short_option():
     args = ['-b', '9600']
     endpoint_factory.build_endpoint("/dev/ttyUSB0", args)
 
-    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 9600)
+    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 9600, False)
     assert args == []
 
 
@@ -61,7 +61,7 @@ def test_build_endpoint_serial_with_specified_baud_long_option():
     args = ['--baud', '9600']
     endpoint_factory.build_endpoint("/dev/ttyUSB0", args)
 
-    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 9600)
+    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 9600, False)
     assert args == []
 
 
@@ -73,7 +73,7 @@ def test_build_endpoint_websocket_with_specified_password_short_option():
     args = ['-p', 'some_password']
     endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", args)
 
-    mock_build_websocket_end_point.assert_called_with("ws://127.0.0.1:8266/", "some_password")
+    mock_build_websocket_end_point.assert_called_with("ws://127.0.0.1:8266/", "some_password", False)
     assert args == []
 
 
@@ -85,7 +85,7 @@ def test_build_endpoint_websocket_with_specified_password_long_option():
     args = ['--password', 'some_password']
     endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", args)
 
-    mock_build_websocket_end_point.assert_called_with("ws://127.0.0.1:8266/", "some_password")
+    mock_build_websocket_end_point.assert_called_with("ws://127.0.0.1:8266/", "some_password", False)
     assert args == []
 
 
@@ -97,3 +97,56 @@ def test_build_endpoint_websocket_without_password_fails():
     args = []
     with pytest.raises(RuntimeError, match=r".*'ws://127.0.0.1:8266/'.*"):
         endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", args)
+
+
+def test_build_endpoint_serial_with_attach_option():
+    endpoint_factory = repl_client.EndpointFactory()
+    mock_build_serial_end_point = Mock()
+    endpoint_factory._build_serial_endpoint = mock_build_serial_end_point
+
+    args = ['-b', '9600', '--attach', 'ls']
+    endpoint_factory.build_endpoint("/dev/ttyUSB0", args)
+
+    mock_build_serial_end_point.assert_called_with("/dev/ttyUSB0", 9600, True)
+    assert args == ['ls']
+
+
+def test_build_endpoint_websocket_attaches_by_default():
+    endpoint_factory = repl_client.EndpointFactory(attach=True)
+    mock_build_websocket_end_point = Mock()
+    endpoint_factory._build_websocket_endpoint = mock_build_websocket_end_point
+
+    args = ['-p', 'some_password']
+    endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", args)
+
+    mock_build_websocket_end_point.assert_called_with("ws://127.0.0.1:8266/", "some_password", True)
+    assert args == []
+
+
+def test_build_endpoint_with_manifest():
+    endpoint_factory = repl_client.EndpointFactory(use_manifest=True)
+
+    endpoint = endpoint_factory.build_endpoint("/tmp", [])
+
+    assert endpoint.manifest_pathname == repl_client.MANIFEST_PATHNAME
+
+
+def test_build_endpoint_serial_applies_timeouts():
+    endpoint_factory = repl_client.EndpointFactory(timeout=2.0, operation_timeout=5.0)
+
+    with patch('serial.Serial') as mock_serial, patch.object(repl_client, 'SerialReplClient') as mock_client:
+        endpoint_factory.build_endpoint("/dev/ttyUSB0", [])
+
+    mock_serial.assert_called_with("/dev/ttyUSB0", 115200, timeout=2.0)
+    mock_client.assert_called_with(mock_serial.return_value, attach=False, operation_timeout=5.0)
+
+
+def test_build_endpoint_websocket_applies_timeouts():
+    endpoint_factory = repl_client.EndpointFactory(timeout=2.0, operation_timeout=5.0)
+
+    with patch('websocket.WebSocket') as mock_websocket, patch.object(repl_client, 'WebReplClient') as mock_client:
+        endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", ['-p', 'some_password'])
+
+    mock_websocket.return_value.settimeout.assert_called_with(2.0)
+    mock_client.assert_called_with(mock_websocket.return_value, password='some_password', attach=False,
+                                   operation_timeout=5.0)
@@ -0,0 +1,80 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from .context import repl_client
+from .fake_device import PtyDevice, WebReplServer
+from .fixtures import root
+
+from repl_client import aio
+
+
+async def exercise(client):
+    content = os.urandom(4096)
+    try:
+        assert await client.eval("1+2") == 3
+        await client.put_file('/test.bin', content)
+        assert await client.get_file('/test.bin') == content
+        assert await client.sha256('/test.bin') == hashlib.sha256(content).digest()
+        assert sorted(await client.listdir('/')) == ['boot.py', 'test.bin']
+        result, error = await client.exec("raise(Exception())")
+        assert error != b""
+    finally:
+        await client.close()
+
+
+def test_serial(root):
+    device = PtyDevice(root)
+
+    async def main():
+        await exercise(await aio.connect_serial(device.port))
+
+    asyncio.run(main())
+    device.close()
+
+
+def test_websocket(root):
+    server = WebReplServer(root)
+
+    async def main():
+        await exercise(await aio.connect_websocket(server.url, 'password'))
+
+    asyncio.run(main())
+    server.close()
+
+
+def test_many_devices_concurrently():
+    roots = [tempfile.mkdtemp() for _ in range(10)]
+    devices = [PtyDevice(root) for root in roots]
+    content = os.urandom(4096)
+
+    async def main():
+        clients = await asyncio.gather(*(aio.connect_serial(device.port) for device in devices))
+        await asyncio.gather(*(client.put_file('/test.bin', content) for client in clients))
+        retval = await asyncio.gather(*(client.get_file('/test.bin') for client in clients))
+        for client in clients:
+            await client.close()
+        return retval
+
+    assert asyncio.run(main()) == [content] * len(devices)
+    for device, root in zip(devices, roots):
+        device.close()
+        shutil.rmtree(root)
+
+
+def test_truncated_response_is_not_success(root):
+    device = PtyDevice(root)
+
+    async def main():
+        client = await aio.connect_serial(device.port)
+        client.set_timeout(0.3)
+        with pytest.raises(TimeoutError):
+            await client.exec("import sys\nsys.stdin.read(1)")
+        client.connection.close()
+
+    asyncio.run(main())
+    device.close()
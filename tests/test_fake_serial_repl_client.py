@@ -0,0 +1,232 @@
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+import pytest
+import serial
+
+from .context import repl_client
+from .fake_device import PtyDevice
+from .fixtures import root
+
+from .filesystem_suite import test_mkdir, test_isdir, test_isfile, test_listdir, test_remove_dir, test_remove_file, \
+    test_put_file, test_put_file_get_file_remove, test_sha256, test_readfile_dne, test_listdir_dne, test_listdir_root, \
+    test_large_file, test_exists, test_put_file_get_file_binary, \
+    test_sha256_many, test_stat_many, test_walk, \
+    test_sha256_with_manifest, test_put_stream_get_stream, test_get_with_chunk_size, \
+    test_pathnames_with_quotes
+from .repl_suite import test_recv_with_timeout, test_recv_until_with_timeout, test_recv_exactly_with_timeout, \
+    test_both_modes, test_exec, \
+    test_exception, test_eval, test_import_is_cached, test_soft_reset_clears_session, test_exec_large_command, \
+    test_exec_without_raw_paste_mode, test_exec_many, test_put_file_get_file_with_and_without_compression, \
+    test_agent, test_put_file_delta, test_with_timeout_restores_timeout_on_exception, \
+    test_operation_timeout_resyncs_stalled_repl, test_put_tree_get_tree
+
+
+def fake_client(root, **kwargs):
+    device = PtyDevice(root, **kwargs)
+    connection = serial.Serial(device.port, 115200, timeout=5)
+    return device, repl_client.SerialReplClient(connection)
+
+
+@pytest.fixture(params=[True, False, 'legacy'], ids=['raw_paste', 'no_raw_paste', 'legacy'])
+def client(request, root):
+    device, retval = fake_client(root, raw_paste=request.param)
+    yield retval
+    retval.close()
+    device.close()
+
+
+def test_put_file_into_missing_directory_recovers(client):
+    with pytest.raises(Exception):
+        client.put_file('/missing/test.txt', b'Hello World!')
+    assert client.eval("1+2") == 3
+
+
+def test_get_file_missing_recovers(client):
+    with pytest.raises(Exception):
+        client.get_file('/missing.txt')
+    assert client.eval("1+2") == 3
+
+
+def test_sync_to_device(client):
+    path = tempfile.mkdtemp()
+    src = repl_client.LocalClient(path)
+    src.mkdir('/lib')
+    src.put_file('/lib/module.py', b'x = 1')
+    src.put_file('/main.py', b'import module')
+
+    assert repl_client.sync(src, client).copied == ['/lib/module.py', '/main.py']
+    assert repl_client.sync(src, client).copied == []
+    shutil.rmtree(path)
+
+
+def test_sync_uploads_large_files_as_delta(root, client):
+    path = tempfile.mkdtemp()
+    src = repl_client.LocalClient(path)
+    content = random.Random(0).randbytes(16384)
+    src.put_file('/bundle.js', content)
+    repl_client.sync(src, client)
+
+    src.put_file('/bundle.js', content[:8000] + b"edited" + content[8006:])
+    client.instrumentation = repl_client.Instrumentation()
+    assert repl_client.sync(src, client).copied == ['/bundle.js']
+    assert client.stats()['bytes_sent'] < len(content) // 2
+    with open(root + '/bundle.js', 'rb') as f:
+        assert f.read() == content[:8000] + b"edited" + content[8006:]
+    shutil.rmtree(path)
+
+
+@pytest.mark.parametrize("deflate, compression", [
+    (True, (True, True)),
+    ('decompress', (True, False)),
+    (False, (False, False)),
+])
+def test_compression_capability_is_detected(root, deflate, compression):
+    device, client = fake_client(root, deflate=deflate)
+    content = b"print('Hello World!')\n" * 500
+
+    assert client.detect_compression() == compression
+    client.put_file('/test.py', content)
+    assert content == client.get_file('/test.py')
+    client.close()
+    device.close()
+
+
+def test_exec_many_fits_device_input_buffer(root):
+    device, client = fake_client(root, raw_paste=False, rx_buffer_size=repl_client.SerialReplClient.PIPELINE_WINDOW)
+    responses = client.exec_many([f"x = {i}" for i in range(100)] + ["print(x, end='')"])
+
+    assert responses[-1] == (b"99", b"")
+    assert device.rx.overrun == 0
+    client.close()
+    device.close()
+
+
+def attach(device):
+    connection = serial.Serial(device.port, 115200, timeout=5)
+    return repl_client.SerialReplClient(connection, attach=True)
+
+
+def test_attach_to_friendly_repl(root):
+    device, client = fake_client(root)
+    client.exec("x = 42")
+    client.enter_repl_mode()
+    client.close()
+
+    client = attach(device)
+    assert client.attached_mode == "friendly"
+    assert not client.in_raw_repl_mode
+    assert client.eval("x") == 42
+    client.close()
+    device.close()
+
+
+def test_attach_to_raw_repl_with_running_program(root):
+    device, client = fake_client(root)
+    client.exec("x = 42")
+    client.send_command("import sys\nsys.stdin.read(1)")
+    client.connection.close()
+
+    client = attach(device)
+    assert client.attached_mode == "raw"
+    assert client.in_raw_repl_mode
+    assert client.eval("x") == 42
+    client.close()
+    device.close()
+
+
+def test_attach_to_interrupted_raw_paste(root):
+    device, client = fake_client(root)
+    client.exec("x = 42")
+    client.enter_raw_repl_mode()
+    client.send(b"\x05A\x01")
+    assert client.recv_exactly(4)[:2] == b"R\x01"
+    client.send(b"x = 1")
+    client.connection.close()
+
+    client = attach(device)
+    assert client.attached_mode == "raw-paste"
+    assert client.in_raw_repl_mode
+    assert client.eval("x") == 42
+    client.close()
+    device.close()
+
+
+def test_operation_timeout_recovers_stalled_agent(client, root):
+    os.mkfifo(root + "/stalled")
+    client.use_agent = True
+    client.operation_timeout = 0.5
+    assert client.exists("/boot.py")
+
+    def unblock():
+        time.sleep(0.7)
+        with open(root + "/stalled", "wb"):
+            pass
+
+    thread = threading.Thread(target=unblock)
+    thread.start()
+    t0 = time.time()
+    with pytest.raises(TimeoutError):
+        client.sha256("/stalled")
+    assert time.time() - t0 < 4
+    thread.join()
+    assert client.eval("1+2") == 3
+    assert client.exists("/boot.py")
+    client.operation_timeout = None
+    client.remove("/stalled")
+
+
+def test_use_manifest(root):
+    device = PtyDevice(root)
+    client = repl_client.SerialReplClient(serial.Serial(device.port, 115200, timeout=5), use_manifest=True)
+    assert client.manifest_pathname == repl_client.MANIFEST_PATHNAME
+    client.put_file('/test.txt', b'Hello World!')
+    assert os.path.exists(root + repl_client.MANIFEST_PATHNAME)
+    client.close()
+    device.close()
+
+
+def test_operation_timeout_is_a_deadline_not_an_idle_timeout(root):
+    device, client = fake_client(root)
+    client.operation_timeout = 0.5
+    t0 = time.time()
+    with pytest.raises(TimeoutError):
+        client.exec("import time\nfor i in range(30):\n  print(i)\n  time.sleep(0.1)")
+    assert time.time() - t0 < 2.5
+    time.sleep(3)
+    client.with_timeout(0.5, client.drain)
+    client.resync()
+    assert client.eval("1+2") == 3
+    client.close()
+    device.close()
+
+
+def test_operation_budget_covers_lists_and_iterators(client):
+    client.operation_timeout = 0.5
+    budgets = []
+    client.enable_instrumentation().add_hook(
+        lambda direction, data: client.deadline is not None and budgets.append(client.deadline - time.monotonic()))
+
+    client.exec_many([f"x{i} = {'1' * 1000}" for i in range(20)])
+    assert max(budgets) > 10
+    budgets.clear()
+
+    client.put_stream('/test.bin', (os.urandom(1024) for i in range(20)))
+    assert max(budgets) > 10
+    client.operation_timeout = None
+    client.remove('/test.bin')
+
+
+@pytest.mark.parametrize("deflate", [False, True])
+def test_get_file_with_chunks_beyond_frame_size(root, deflate):
+    device, client = fake_client(root, deflate=deflate)
+    for content in (os.urandom(50000), b"Hello World!" * 5000):
+        client.put_file('/test.bin', content)
+        assert content == client.get_file('/test.bin', chunk_size=32768)
+        assert {'/test.bin': content} == client.get_tree(['/test.bin'], chunk_size=32768)
+    client.close()
+    device.close()
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import time
+
+import pytest
+import websocket
+
+from .context import repl_client
+from .fake_device import WebReplServer
+from .fixtures import root
+
+from .filesystem_suite import test_mkdir, test_isdir, test_isfile, test_listdir, test_remove_dir, test_remove_file, \
+    test_put_file, test_put_file_get_file_remove, test_sha256, test_readfile_dne, test_listdir_dne, test_listdir_root, \
+    test_large_file, test_exists, test_put_file_get_file_binary, \
+    test_sha256_many, test_stat_many, test_walk, \
+    test_sha256_with_manifest, test_put_stream_get_stream, test_get_with_chunk_size, \
+    test_pathnames_with_quotes
+from .repl_suite import test_recv_with_timeout, test_recv_until_with_timeout, test_recv_exactly_with_timeout, \
+    test_both_modes, test_exec, \
+    test_exception, test_eval, test_import_is_cached, test_soft_reset_clears_session, test_exec_large_command, \
+    test_exec_without_raw_paste_mode, test_exec_many, test_put_file_get_file_with_and_without_compression, \
+    test_agent, test_put_file_delta, test_with_timeout_restores_timeout_on_exception, \
+    test_operation_timeout_resyncs_stalled_repl, test_put_tree_get_tree
+
+
+def fake_client(root, **kwargs):
+    server = WebReplServer(root, **kwargs)
+    connection = websocket.WebSocket()
+    connection.connect(server.url)
+    connection.settimeout(5)
+    return server, repl_client.WebReplClient(connection, password='password')
+
+
+@pytest.fixture(params=[False, True], ids=['separate_frames', 'coalesced_frames'])
+def client(request, root):
+    server, retval = fake_client(root, coalesce=request.param)
+    yield retval
+    retval.close()
+    server.close()
+
+
+def test_put_file_without_compression_uses_webrepl_protocol(client):
+    client.use_compression = False
+    client.put_file('/test.bin', bytes(range(256)) * 8)
+    assert bytes(range(256)) * 8 == client.get_file('/test.bin')
+
+
+def test_get_file_missing_recovers(client):
+    with pytest.raises(Exception):
+        client.get_file('/missing.txt')
+    assert client.eval("1+2") == 3
+
+
+@pytest.mark.parametrize("size", [0, 1, 255, 256, 257, 4096, 10000])
+def test_get_file_windowed(client, size):
+    content = bytes(i % 251 for i in range(size))
+    client.put_file('/test.bin', content, chunk_size=512)
+    for window in (1, 4, 64):
+        assert content == client.get_file('/test.bin', window=window)
+        sink = io.BytesIO()
+        assert client.get_stream('/test.bin', sink, window=window) == size
+        assert content == sink.getvalue()
+    assert client.eval("1+2") == 3
+
+
+def test_get_file_windowed_overlaps_latency(root):
+    server, client = fake_client(root, latency=0.01)
+    content = bytes(range(256)) * 40
+    client.put_file('/test.bin', content)
+
+    t0 = time.monotonic()
+    assert content == client.get_file('/test.bin', window=1)
+    lockstep = time.monotonic() - t0
+    t0 = time.monotonic()
+    assert content == client.get_file('/test.bin')
+    windowed = time.monotonic() - t0
+
+    assert windowed * 2 < lockstep
+    client.close()
+    server.close()
+
+
+def test_attach(root):
+    server = WebReplServer(root)
+    connection = websocket.WebSocket()
+    connection.connect(server.url)
+    connection.settimeout(5)
+    client = repl_client.WebReplClient(connection, password='password', attach=True)
+    assert client.attached_mode == "friendly"
+    assert client.eval("1+2") == 3
+    client.close()
+    server.close()
+
+
+def test_put_stream_without_compression_matches_base_signature(client):
+    client.use_compression = False
+    content = bytes(range(256)) * 40
+    client.put_stream('/test.bin', io.BytesIO(content), 4096)
+    assert content == client.get_file('/test.bin')
+
+    with pytest.raises(RuntimeError):
+        client.put_stream('/test.bin', io.BytesIO(content), size=4096)
+    assert client.eval("1+2") == 3
+
+
+def test_fast_link_keeps_webrepl_put_file(root):
+    server, client = fake_client(root)
+    content = b"print('Hello World!')\n" * 2000
+    client.put_file('/first.py', content)
+    instrumentation = client.enable_instrumentation()
+    client.put_file('/second.py', content)
+    assert client.throughput is not None
+    assert instrumentation.round_trips < 10
+    assert content == client.get_file('/second.py')
+    client.close()
+    server.close()
+
+
+def test_slow_link_transfers_compressed(root):
+    server, client = fake_client(root)
+    content = b"print('Hello World!')\n" * 2000
+    client.throughput = 1000
+    client.put_file('/test.py', content)
+    with open(root + '/test.py', 'rb') as f:
+        assert content == f.read()
+    assert not client.exists('/test.py' + client.COMPRESSED_SUFFIX)
+
+    client.throughput = 1000
+    assert content == client.get_file('/test.py')
+    assert not client.exists('/test.py' + client.COMPRESSED_SUFFIX)
+
+    noise = bytes(i * 7919 % 251 for i in range(5000))
+    client.throughput = 1000
+    client.put_file('/noise.bin', noise)
+    client.throughput = 1000
+    assert noise == client.get_file('/noise.bin')
+    assert client.sha256('/noise.bin') == hashlib.sha256(noise).digest()
+    assert client.eval("1+2") == 3
+    client.close()
+    server.close()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import time
+from unittest.mock import Mock
+
+import pytest
+
+from .context import repl_client
+
+
+def mock_endpoint_factory(endpoints):
+    endpoint_factory = Mock()
+    endpoint_factory.build_endpoint.side_effect = lambda name, args: endpoints[name]
+    endpoint_factory.release.side_effect = lambda endpoint: endpoint.close()
+    return endpoint_factory
+
+
+def test_run_returns_per_device_results():
+    endpoints = {'/dev/ttyUSB0': Mock(), '/dev/ttyUSB1': Mock()}
+    endpoints['/dev/ttyUSB0'].eval.return_value = 3
+    endpoints['/dev/ttyUSB1'].eval.return_value = 4
+    fleet = repl_client.Fleet(['/dev/ttyUSB0', '/dev/ttyUSB1'], endpoint_factory=mock_endpoint_factory(endpoints))
+
+    results = fleet.eval("1+2")
+
+    assert [(r.name, r.result, r.error) for r in results] == [('/dev/ttyUSB0', 3, None), ('/dev/ttyUSB1', 4, None)]
+    assert all(r.elapsed >= 0 for r in results)
+
+
+def test_specs_pass_arguments_to_endpoint_factory():
+    endpoint_factory = mock_endpoint_factory({'/dev/ttyUSB0': Mock()})
+    fleet = repl_client.Fleet([('/dev/ttyUSB0', ['-b', '9600'])], endpoint_factory=endpoint_factory)
+
+    fleet.connect()
+
+    endpoint_factory.build_endpoint.assert_called_with('/dev/ttyUSB0', ['-b', '9600'])
+
+
+def test_run_is_concurrent():
+    endpoints = {f'/dev/ttyUSB{i}': Mock() for i in range(8)}
+    for endpoint in endpoints.values():
+        endpoint.exec.side_effect = lambda command: time.sleep(0.2)
+    fleet = repl_client.Fleet(list(endpoints), max_workers=8, endpoint_factory=mock_endpoint_factory(endpoints))
+    fleet.connect()
+
+    t0 = time.time()
+    fleet.exec("pass")
+    t = time.time() - t0
+
+    assert t < 0.2 * 4
+
+
+def test_run_captures_errors():
+    endpoints = {'/dev/ttyUSB0': Mock(), '/dev/ttyUSB1': Mock()}
+    endpoints['/dev/ttyUSB0'].put_file.side_effect = RuntimeError("boom")
+    fleet = repl_client.Fleet(list(endpoints), endpoint_factory=mock_endpoint_factory(endpoints))
+
+    results = fleet.put_file('/main.py', b'')
+
+    assert isinstance(results[0].error, RuntimeError)
+    assert results[1].error is None
+    endpoints['/dev/ttyUSB1'].put_file.assert_called_with('/main.py', b'')
+
+
+def test_connection_failures_are_reported():
+    endpoint_factory = Mock()
+    endpoint_factory.build_endpoint.side_effect = RuntimeError("no such device")
+    fleet = repl_client.Fleet(['/dev/ttyUSB0'], endpoint_factory=endpoint_factory)
+
+    results = fleet.exec("pass")
+
+    assert results[0].name == '/dev/ttyUSB0'
+    assert isinstance(results[0].error, RuntimeError)
+
+
+def test_close_closes_endpoints():
+    endpoints = {'/dev/ttyUSB0': Mock()}
+    with repl_client.Fleet(list(endpoints), endpoint_factory=mock_endpoint_factory(endpoints)) as fleet:
+        fleet.connect()
+
+    endpoints['/dev/ttyUSB0'].close.assert_called_with()
+    assert fleet.endpoints == {}
+
+
+def test_sync_snapshots_source_once():
+    src_root = tempfile.mkdtemp()
+    os.mkdir(src_root + "/lib")
+    for i in range(10):
+        with open(src_root + f"/lib/module{i}.py", "wb") as f:
+            f.write(f"x = {i}\n".encode('utf-8') * 1000)
+    src = repl_client.LocalClient(src_root)
+    src.manifest_pathname = "/.manifest"
+    src.walk = Mock(side_effect=src.walk)
+    src.sha256_many = Mock(side_effect=src.sha256_many)
+    endpoints = {f'/dev/ttyUSB{i}': repl_client.LocalClient(tempfile.mkdtemp()) for i in range(4)}
+
+    try:
+        with repl_client.Fleet(list(endpoints), endpoint_factory=mock_endpoint_factory(endpoints)) as fleet:
+            results = fleet.sync(src)
+
+        assert all(result.error is None for result in results)
+        assert src.walk.call_count == 1
+        assert src.sha256_many.call_count == 1
+        for endpoint in endpoints.values():
+            assert endpoint.get_file("/lib/module3.py") == b"x = 3\n" * 1000
+    finally:
+        shutil.rmtree(src_root)
+        for endpoint in endpoints.values():
+            shutil.rmtree(endpoint.root)
+
+
+def test_duplicate_specs_are_collapsed():
+    root = tempfile.mkdtemp()
+    try:
+        endpoint_factory = repl_client.PooledEndpointFactory()
+        fleet = repl_client.Fleet([root, (root, [])], endpoint_factory=endpoint_factory)
+
+        results = fleet.run(lambda endpoint: endpoint.root)
+
+        assert [(r.name, r.result, r.error) for r in results] == [(root, root, None)]
+        fleet.close()
+        endpoint_factory.close()
+    finally:
+        shutil.rmtree(root)
+
+
+def test_conflicting_duplicate_specs_are_rejected():
+    with pytest.raises(RuntimeError):
+        repl_client.Fleet(['/dev/ttyUSB0', ('/dev/ttyUSB0', ['-b', '9600'])], endpoint_factory=Mock())
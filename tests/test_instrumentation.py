@@ -0,0 +1,37 @@
+from .context import repl_client
+from .fixtures import web_client
+
+
+def test_disabled_by_default():
+    client = web_client("Password: ", ">>> ")
+
+    assert client.instrumentation is None
+    assert client.stats() is None
+
+
+def test_eval_records_bytes_round_trips_and_timings():
+    client = web_client("Password: ", ">>> ", "raw REPL; CTRL-B to exit\r\n>", "OK3\x04\x04>")
+    client.use_raw_paste_mode = False
+    trace = repl_client.WireTrace()
+    client.enable_instrumentation().add_hook(trace)
+
+    assert client.eval("1+2") == 3
+
+    stats = client.stats()
+    assert stats["bytes_sent"] == sum(len(data) for _, direction, data in trace.records if direction == "send")
+    assert stats["bytes_received"] == len(b"raw REPL; CTRL-B to exit\r\n>OK3\x04\x04>")
+    assert stats["round_trips"] == 2
+    assert stats["timings"]["eval"]["count"] == 1
+    assert stats["timings"]["exec"]["count"] == 1
+    assert [direction for _, direction, _ in trace.records] == ["send", "recv", "send", "send", "recv"]
+
+
+def test_sleep_is_recorded():
+    client = web_client("Password: ", ">>> ")
+    instrumentation = client.enable_instrumentation()
+
+    client.sleep(0.01)
+
+    assert instrumentation.snapshot()["sleep_time"] == 0.01
+    instrumentation.reset()
+    assert instrumentation.snapshot()["sleep_time"] == 0.0
@@ -1,3 +1,4 @@
+import hashlib
 import shutil
 
 import pytest
@@ -7,7 +8,10 @@ from .context import repl_client
 
 from .filesystem_suite import test_mkdir, test_isdir, test_isfile, test_listdir, test_remove_dir, test_remove_file, \
     test_put_file, test_put_file_get_file_remove, test_sha256, test_readfile_dne, test_listdir_dne, test_listdir_root, \
-    test_large_file, test_exists
+    test_large_file, test_exists, test_put_file_get_file_binary, \
+    test_sha256_many, test_stat_many, test_walk, \
+    test_sha256_with_manifest, test_put_stream_get_stream, test_get_with_chunk_size, \
+    test_pathnames_with_quotes
 
 
 @pytest.fixture
@@ -19,3 +23,57 @@ def client():
     yield retval
     shutil.rmtree(path)
     retval.close()
+
+
+def test_manifest_detects_external_changes(client):
+    client.manifest_pathname = '/.repl_client_manifest'
+    client.put_file('/test.txt', b'Hello World!')
+    assert hashlib.sha256(b'Hello World!').digest() == client.sha256('/test.txt')
+    with open(client.root + '/test.txt', 'wb') as f:
+        f.write(b'Goodbye World!')
+    assert hashlib.sha256(b'Goodbye World!').digest() == client.sha256('/test.txt')
+
+
+def test_sha256_many_hashes_in_parallel(client):
+    contents = {f'/file{i}.bin': bytes([i]) * (i * 100000) for i in range(8)}
+    for pathname, content in contents.items():
+        client.put_file(pathname, content)
+    expected = [hashlib.sha256(content).digest() for content in contents.values()]
+
+    assert client.sha256_many(list(contents)) == expected
+    client.max_workers = 1
+    assert client.sha256_many(list(contents)) == expected
+    client.max_workers = 4
+    client.manifest_pathname = '/.repl_client_manifest'
+    assert client.sha256_many(list(contents)) == expected
+    assert sorted(client.load_manifest()) == sorted(contents)
+
+
+def test_snapshot(client):
+    client.mkdir('/lib')
+    client.put_file('/lib/module.py', b'x = 1')
+    client.put_file('/main.py', b'import module')
+
+    snapshot = client.snapshot()
+    assert sorted(snapshot) == ['/boot.py', '/lib', '/lib/module.py', '/main.py']
+    assert snapshot['/lib'].stat.isdir
+    assert snapshot['/lib'].sha256 is None
+    assert snapshot['/main.py'].stat.size == len(b'import module')
+    assert snapshot['/main.py'].sha256 == hashlib.sha256(b'import module').digest()
+    assert sorted(client.snapshot('/lib')) == ['/lib/module.py']
+
+
+def test_put_tree_get_tree(client):
+    files = {'/lib/pkg/module.py': b'x = 1', '/lib/other.py': b'y = 2', '/main.py': b'import pkg'}
+    client.put_tree(files)
+    assert client.isdir('/lib/pkg')
+    assert client.get_tree(sorted(files)) == files
+
+
+def test_use_manifest_defaults_to_manifest_pathname(client):
+    assert client.manifest_pathname is None
+    client = repl_client.LocalClient(client.root, use_manifest=True)
+    assert client.manifest_pathname == repl_client.MANIFEST_PATHNAME
+    client.put_file('/test.txt', b'Hello World!')
+    assert '/test.txt' in client.load_manifest()
+    assert repl_client.MANIFEST_PATHNAME not in client.walk()
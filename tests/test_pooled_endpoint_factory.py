@@ -0,0 +1,118 @@
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from .context import repl_client
+
+
+def live_endpoint():
+    endpoint = Mock()
+    endpoint.with_timeout.return_value = 1
+    return endpoint
+
+
+def test_build_endpoint_reuses_live_endpoint():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+    endpoint = live_endpoint()
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', return_value=endpoint) as build:
+        assert endpoint_factory.build_endpoint("/dev/ttyUSB0", []) is endpoint
+        endpoint_factory.release(endpoint)
+        assert endpoint_factory.build_endpoint("/dev/ttyUSB0", []) is endpoint
+
+    build.assert_called_once_with("/dev/ttyUSB0", 115200, False)
+
+
+def test_build_endpoint_distinguishes_arguments():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', side_effect=lambda n, b, a: live_endpoint()):
+        fast = endpoint_factory.build_endpoint("/dev/ttyUSB0", ['-b', '115200'])
+        slow = endpoint_factory.build_endpoint("/dev/ttyUSB0", ['-b', '9600'])
+
+    assert fast is not slow
+
+
+def test_build_endpoint_reconnects_when_probe_fails():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+    dead = live_endpoint()
+    alive = live_endpoint()
+    with patch.object(repl_client.EndpointFactory, '_build_websocket_endpoint', side_effect=[dead, alive]):
+        endpoint_factory.release(endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", ['-p', 'password']))
+        dead.with_timeout.side_effect = Exception()
+        assert endpoint_factory.build_endpoint("ws://127.0.0.1:8266/", ['-p', 'password']) is alive
+
+    dead.close.assert_called_with()
+
+
+def test_idle_endpoints_expire():
+    endpoint_factory = repl_client.PooledEndpointFactory(max_idle=0.0)
+    first = live_endpoint()
+    second = live_endpoint()
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', side_effect=[first, second]):
+        endpoint_factory.release(endpoint_factory.build_endpoint("/dev/ttyUSB0", []))
+        assert endpoint_factory.build_endpoint("/dev/ttyUSB0", []) is second
+
+    first.close.assert_called_with()
+
+
+def test_local_endpoints_are_pooled():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+
+    endpoint = endpoint_factory.build_endpoint("/tmp", [])
+    endpoint_factory.release(endpoint)
+    assert endpoint_factory.build_endpoint("/tmp", []) is endpoint
+
+
+def test_close_closes_all_endpoints():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+    endpoint = live_endpoint()
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', return_value=endpoint):
+        endpoint_factory.release(endpoint_factory.build_endpoint("/dev/ttyUSB0", []))
+    endpoint_factory.close()
+
+    endpoint.close.assert_called_with()
+    assert endpoint_factory.pool == {}
+
+
+def test_attach_applies_to_new_connections():
+    endpoint_factory = repl_client.PooledEndpointFactory(attach=True)
+    endpoint = live_endpoint()
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', return_value=endpoint) as build:
+        assert endpoint_factory.build_endpoint("/dev/ttyUSB0", []) is endpoint
+        endpoint_factory.release(endpoint)
+        assert endpoint_factory.build_endpoint("/dev/ttyUSB0", ['--attach']) is endpoint
+
+    build.assert_called_once_with("/dev/ttyUSB0", 115200, True)
+
+
+def test_endpoints_are_checked_out_exclusively():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+    endpoint = live_endpoint()
+    events = []
+
+    def use(name):
+        checked_out = endpoint_factory.build_endpoint("/dev/ttyUSB0", [])
+        events.append((name, "start"))
+        time.sleep(0.05)
+        events.append((name, "end"))
+        endpoint_factory.release(checked_out)
+
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', return_value=endpoint) as build:
+        threads = [threading.Thread(target=use, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    build.assert_called_once_with("/dev/ttyUSB0", 115200, False)
+    assert all(events[i][0] == events[i + 1][0] for i in range(0, len(events), 2))
+
+
+def test_failed_build_does_not_block_later_checkouts():
+    endpoint_factory = repl_client.PooledEndpointFactory()
+    endpoint = live_endpoint()
+    with patch.object(repl_client.EndpointFactory, '_build_serial_endpoint', side_effect=[OSError(), endpoint]):
+        with pytest.raises(OSError):
+            endpoint_factory.build_endpoint("/dev/ttyUSB0", [])
+        assert endpoint_factory.build_endpoint("/dev/ttyUSB0", []) is endpoint
@@ -0,0 +1,54 @@
+from unittest.mock import Mock
+
+from .context import repl_client
+from .fixtures import web_client
+
+
+def test_recv_until_keeps_bytes_after_delimiter():
+    client = web_client("Password: ", "\r\nWebREPL connected\r\n>>> ", "3\x04\x04>")
+
+    assert client.read_response() == (b"3", b"")
+    assert client.recv() == b">"
+
+
+def test_recv_until_finds_delimiter_split_across_frames():
+    client = web_client("Password: ", "\r\nWebREPL connected\r\n>", ">", "> tail")
+
+    assert client.recv(-1) == b"tail"
+
+
+def test_recv_respects_size():
+    client = web_client("Password: ", ">>> ", "abcdef")
+
+    assert client.recv(2) == b"ab"
+    assert client.recv_exactly(3) == b"cde"
+    assert client.recv() == b"f"
+
+
+def test_recv_until_returns_partial_data_on_timeout():
+    client = web_client("Password: ", ">>> ", "partial")
+
+    assert client.recv_until(b"\x04") == b"partial"
+    assert client.recv() == b""
+
+
+def test_send_accepts_str_bytes_and_memoryview():
+    client = web_client("Password: ", ">>> ")
+
+    client.send("text")
+    client.send(b"bytes")
+    client.send(memoryview(b"view"))
+
+    assert [c.args[0] for c in client.connection.send.call_args_list[-3:]] == ["text", b"bytes", b"view"]
+
+
+def test_serial_recv_until_reads_available_bytes():
+    connection = Mock()
+    connection.timeout = None
+    connection.in_waiting = 0
+    connection.read.side_effect = [b">>> ", b"OK3", b"\x04\x04>"]
+    client = repl_client.SerialReplClient(connection)
+
+    assert client.recv_exactly(2) == b"OK"
+    assert client.read_response() == (b"3", b"")
+    assert client.recv() == b">"
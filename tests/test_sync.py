@@ -0,0 +1,95 @@
+import shutil
+import tempfile
+
+import pytest
+
+from .context import repl_client
+
+
+@pytest.fixture
+def src():
+    path = tempfile.mkdtemp()
+    retval = repl_client.LocalClient(path)
+    yield retval
+    shutil.rmtree(path)
+    retval.close()
+
+
+@pytest.fixture
+def dst():
+    path = tempfile.mkdtemp()
+    retval = repl_client.LocalClient(path)
+    yield retval
+    shutil.rmtree(path)
+    retval.close()
+
+
+def test_sync_copies_new_files_and_directories(src, dst):
+    src.mkdir('/lib')
+    src.put_file('/lib/module.py', b'print("Hello World!")')
+    src.put_file('/main.py', b'import module')
+
+    result = repl_client.sync(src, dst)
+
+    assert result.created == ['/lib']
+    assert result.copied == ['/lib/module.py', '/main.py']
+    assert result.removed == []
+    assert dst.get_file('/lib/module.py') == b'print("Hello World!")'
+    assert dst.get_file('/main.py') == b'import module'
+
+
+def test_sync_copies_only_changed_files(src, dst):
+    src.put_file('/same.py', b'same')
+    src.put_file('/resized.py', b'longer content')
+    src.put_file('/edited.py', b'new!')
+    dst.put_file('/same.py', b'same')
+    dst.put_file('/resized.py', b'short')
+    dst.put_file('/edited.py', b'old!')
+
+    result = repl_client.sync(src, dst)
+
+    assert result.copied == ['/edited.py', '/resized.py']
+    assert dst.get_file('/resized.py') == b'longer content'
+    assert dst.get_file('/edited.py') == b'new!'
+
+
+def test_sync_is_idempotent(src, dst):
+    src.mkdir('/lib')
+    src.put_file('/lib/module.py', b'print("Hello World!")')
+
+    repl_client.sync(src, dst)
+    result = repl_client.sync(src, dst)
+
+    assert result == ([], [], [])
+
+
+def test_sync_keeps_extra_files_by_default(src, dst):
+    dst.put_file('/extra.py', b'')
+
+    result = repl_client.sync(src, dst)
+
+    assert result.removed == []
+    assert dst.exists('/extra.py')
+
+
+def test_sync_removes_extra_files_on_request(src, dst):
+    dst.mkdir('/extra')
+    dst.put_file('/extra/module.py', b'')
+    dst.put_file('/extra.py', b'')
+
+    result = repl_client.sync(src, dst, delete=True)
+
+    assert result.removed == ['/extra/module.py', '/extra.py', '/extra']
+    assert dst.listdir() == []
+
+
+def test_sync_replaces_directory_with_file(src, dst):
+    src.put_file('/module', b'content')
+    dst.mkdir('/module')
+    dst.put_file('/module/__init__.py', b'')
+
+    result = repl_client.sync(src, dst)
+
+    assert result.removed == ['/module/__init__.py', '/module']
+    assert result.copied == ['/module']
+    assert dst.get_file('/module') == b'content'
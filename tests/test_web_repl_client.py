@@ -1,57 +1,23 @@
 import pytest
-import time
 
 from .common import web_client, serial_client
 from .config import WIFI_CREDENTIALS
 
 from .filesystem_suite import test_mkdir, test_isdir, test_isfile, test_listdir, test_remove_dir, test_remove_file, \
     test_put_file, test_put_file_get_file_remove, test_sha256, test_readfile_dne, test_listdir_dne, test_listdir_root, \
-    test_large_file, test_exists
+    test_large_file, test_exists, test_put_file_get_file_binary, \
+    test_sha256_many, test_stat_many, test_walk, \
+    test_sha256_with_manifest, test_put_stream_get_stream, test_get_with_chunk_size, \
+    test_pathnames_with_quotes
+from .repl_suite import test_recv_with_timeout, test_recv_until_with_timeout, test_recv_exactly_with_timeout, \
+    test_both_modes, test_exec, \
+    test_exception, test_eval, test_import_is_cached, test_soft_reset_clears_session, test_exec_large_command, \
+    test_exec_without_raw_paste_mode, test_exec_many, test_put_file_get_file_with_and_without_compression, \
+    test_agent, test_put_file_delta, test_with_timeout_restores_timeout_on_exception, \
+    test_operation_timeout_resyncs_stalled_repl, test_put_tree_get_tree
 
 
 @pytest.fixture
 def client():
     with web_client(WIFI_CREDENTIALS['ssid'], WIFI_CREDENTIALS['psk']) as retval:
         yield retval
-
-
-def test_recv_with_timeout(client):
-    t0 = time.time()
-    retval = client.with_timeout(1.0, lambda: client.recv())
-    t = time.time() - t0
-    assert retval == b''
-    assert t > 0.99
-
-
-def test_recv_until_with_timeout(client):
-    t0 = time.time()
-    retval = client.with_timeout(1.0, lambda: client.recv_until(b'>>> '))
-    t = time.time() - t0
-    assert retval == b''
-    assert t > 0.99
-
-
-def test_both_modes(client):
-    assert not client.in_raw_repl_mode
-    client.enter_raw_repl_mode()
-    assert client.in_raw_repl_mode
-    client.enter_repl_mode()
-    assert not client.in_raw_repl_mode
-
-
-def test_exec(client):
-    result, error = client.exec("print(repr(1+2), end='')")
-
-    assert result == b"3"
-    assert error == b""
-
-
-def test_exception(client):
-    result, error = client.exec("raise(Exception())")
-
-    assert result == b""
-    assert error != b""
-
-
-def test_eval(client):
-    assert client.eval("1+2") == 3